@@ -0,0 +1,131 @@
+"""Time and SQL statements to delete a user with many todos.
+
+Compares deleting the todos row by row through the ORM (what the
+`delete-orphan` cascade did), in batches, and leaving them to the
+`ON DELETE CASCADE` of `todos.user_id`. Run against a throwaway database,
+tables are created and dropped:
+
+    DATABASE_URL=postgresql+psycopg://... python -m benchmarks.delete_user
+"""
+
+import asyncio
+from time import perf_counter
+
+from sqlalchemy import delete, event, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from fast_api_exercise.models.user import Todo, User, table_registry
+from fast_api_exercise.settings import Settings
+
+TODOS = 100_000
+BATCH_SIZE = 1000
+
+
+async def orm_per_row(session: AsyncSession, user_id: int) -> None:
+    user = await session.scalar(
+        select(User)
+        .where(User.id == user_id)
+        .options(selectinload(User.todos))
+    )
+
+    for todo in user.todos:
+        await session.delete(todo)
+
+    await session.flush()
+    await session.delete(user)
+    await session.commit()
+
+
+async def batched(session: AsyncSession, user_id: int) -> None:
+    batch = (
+        select(Todo.id)
+        .where(Todo.user_id == user_id)
+        .limit(BATCH_SIZE)
+        .scalar_subquery()
+    )
+
+    while True:
+        deleted = await session.execute(delete(Todo).where(Todo.id.in_(batch)))
+        await session.commit()
+
+        if deleted.rowcount < BATCH_SIZE:
+            break
+
+    await session.execute(delete(User).where(User.id == user_id))
+    await session.commit()
+
+
+async def passive_cascade(session: AsyncSession, user_id: int) -> None:
+    # the ORM path of delete_user: the todos are never loaded
+    user = await session.scalar(select(User).where(User.id == user_id))
+    await session.delete(user)
+    await session.commit()
+
+
+async def create_user(session: AsyncSession, n: int) -> int:
+    user = User(username=f'bench{n}', email=f'bench{n}@b.com', password='x')
+    session.add(user)
+    await session.flush()
+
+    series = select(func.generate_series(1, TODOS).label('n')).subquery()
+    await session.execute(
+        insert(Todo).from_select(
+            ['title', 'description', 'user_id'],
+            select(
+                func.concat('todo ', series.c.n),
+                literal('bench'),
+                literal(user.id),
+            ),
+        )
+    )
+    await session.commit()
+
+    return user.id
+
+
+async def main():
+    engine = create_async_engine(Settings().DATABASE_URL)
+    statements = []
+
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    event.listen(
+        engine.sync_engine,
+        'before_cursor_execute',
+        lambda *args: statements.append(args[2]),
+    )
+
+    strategies = {
+        'ORM, row by row': orm_per_row,
+        'batched DELETE': batched,
+        'ON DELETE CASCADE': passive_cascade,
+    }
+
+    print(f'{"strategy":<20} {"seconds":>8} {"statements":>10}')
+
+    for n, (name, strategy) in enumerate(strategies.items()):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            user_id = await create_user(session, n)
+            statements.clear()
+
+            start = perf_counter()
+            await strategy(session, user_id)
+            elapsed = perf_counter() - start
+            count = len(statements)
+
+            assert not await session.scalar(
+                select(func.count(Todo.id)).where(Todo.user_id == user_id)
+            )
+
+        print(f'{name:<20} {elapsed:>8.2f} {count:>10}')
+
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.drop_all)
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
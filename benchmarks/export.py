@@ -0,0 +1,128 @@
+"""Throughput and peak memory of `GET /todos/export` against the list route.
+
+Seeds one user with `ROWS` todos and reads them back, once streamed
+through the export endpoint and once materialized by `GET /todos/` with
+a page as large as the whole set. Requests go straight to the ASGI app
+and body chunks are dropped as they arrive, so the numbers are the
+server's alone (TestClient buffers whole responses). Run against a
+throwaway database, tables are created and dropped:
+
+    DATABASE_URL=postgresql+psycopg://... python -m benchmarks.export
+"""
+
+import asyncio
+import tracemalloc
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+
+from fast_api_exercise.app import app
+from fast_api_exercise.models.user import table_registry
+from fast_api_exercise.security import Principal, create_user_access_token
+from fast_api_exercise.settings import Settings
+
+ROWS = 1_000_000
+
+
+async def get(path: str, token: str) -> int:
+    """GET `path` and return the size of the body, without keeping it."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+        'state': {},
+    }
+    size = 0
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if requested:
+            # StreamingResponse waits on this for a client disconnect
+            await asyncio.Event().wait()
+
+        requested = True
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal size
+        if message['type'] == 'http.response.start':
+            assert message['status'] == 200  # noqa: PLR2004
+        elif message['type'] == 'http.response.body':
+            size += len(message.get('body', b''))
+
+    await app(scope, receive, send)
+
+    return size
+
+
+async def measure(path: str, token: str) -> tuple[float, float]:
+    start = perf_counter()
+    await get(path, token)
+    elapsed = perf_counter() - start
+
+    tracemalloc.start()
+    await get(path, token)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak / 2**20
+
+
+async def run(token: str):
+    routes = {
+        'export ndjson': '/todos/export?format=ndjson',
+        'export csv': '/todos/export?format=csv',
+        'list (one page)': f'/todos/?limit={ROWS}',
+    }
+
+    print(f'{ROWS} todos')
+    print(f'{"route":<16} {"seconds":>8} {"rows/s":>10} {"peak MiB":>9}')
+
+    async with app.router.lifespan_context(app):
+        for name, path in routes.items():
+            elapsed, peak = await measure(path, token)
+            print(
+                f'{name:<16} {elapsed:>8.2f} {ROWS / elapsed:>10.0f} '
+                f'{peak:>9.1f}'
+            )
+
+
+def main():
+    setup_engine = create_engine(Settings().DATABASE_URL)
+    table_registry.metadata.create_all(setup_engine)
+
+    with setup_engine.begin() as connection:
+        user_id = connection.execute(
+            text(
+                'INSERT INTO users (username, email, password) '
+                "VALUES ('bench', 'b@b.com', 'x') RETURNING id"
+            )
+        ).scalar_one()
+        connection.execute(
+            text(
+                'INSERT INTO todos (title, description, state, user_id) '
+                "SELECT 'todo ' || n, 'bench', 'todo', :user_id "
+                'FROM generate_series(1, :rows) AS n'
+            ),
+            {'rows': ROWS, 'user_id': user_id},
+        )
+
+    token = create_user_access_token(Principal(user_id, 'b@b.com', 0))
+    asyncio.run(run(token))
+
+    table_registry.metadata.drop_all(setup_engine)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Rows per second of `POST /todos/import` against the JSON write routes.
+
+Loads the same todos through the import endpoint (COPY), `POST
+/todos/bulk` in batches of `BULK_MAX_ITEMS` and one `POST /todos/` per
+todo. Run against a throwaway database, tables are created and dropped:
+
+    DATABASE_URL=postgresql+psycopg://... python -m benchmarks.import_todos
+"""
+
+import json
+from time import perf_counter
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from fast_api_exercise.app import app
+from fast_api_exercise.models.user import table_registry
+from fast_api_exercise.routers.todos import BULK_MAX_ITEMS
+from fast_api_exercise.settings import Settings
+
+ROWS = 100_000
+# single-row POSTs are slow, their rate is measured on fewer rows
+SINGLE_ROWS = 2_000
+
+
+def todos(count: int) -> list[dict]:
+    return [
+        {'title': f'todo {n}', 'description': 'imported from the backlog'}
+        for n in range(count)
+    ]
+
+
+def ndjson(rows: list[dict]) -> bytes:
+    return ''.join(json.dumps(row) + '\n' for row in rows).encode()
+
+
+def csv(rows: list[dict]) -> bytes:
+    lines = ['title,description']
+    lines += [f'{row["title"]},{row["description"]}' for row in rows]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def main():
+    setup_engine = create_engine(Settings().DATABASE_URL)
+    table_registry.metadata.create_all(setup_engine)
+
+    with TestClient(app) as client:
+        client.post(
+            '/users/',
+            json={'username': 'bench', 'email': 'b@b.com', 'password': 'x'},
+        )
+        token = client.post(
+            '/auth/token', data={'username': 'b@b.com', 'password': 'x'}
+        ).json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        rows = todos(ROWS)
+
+        def import_todos(format, body):
+            def run():
+                response = client.post(
+                    f'/todos/import?format={format}',
+                    headers=headers,
+                    content=body,
+                )
+                assert response.json()['imported'] == ROWS
+                return ROWS
+
+            return run
+
+        def bulk():
+            for start in range(0, ROWS, BULK_MAX_ITEMS):
+                client.post(
+                    '/todos/bulk',
+                    headers=headers,
+                    json=rows[start : start + BULK_MAX_ITEMS],
+                )
+            return ROWS
+
+        def single():
+            for row in rows[:SINGLE_ROWS]:
+                client.post('/todos/', headers=headers, json=row)
+            return SINGLE_ROWS
+
+        routes = {
+            'import ndjson': import_todos('ndjson', ndjson(rows)),
+            'import csv': import_todos('csv', csv(rows)),
+            'POST /todos/bulk': bulk,
+            'POST /todos/': single,
+        }
+
+        print(f'{"route":<18} {"rows":>8} {"seconds":>8} {"rows/s":>10}')
+
+        for name, run in routes.items():
+            start = perf_counter()
+            count = run()
+            elapsed = perf_counter() - start
+            print(
+                f'{name:<18} {count:>8} {elapsed:>8.2f} '
+                f'{count / elapsed:>10.0f}'
+            )
+
+    table_registry.metadata.drop_all(setup_engine)
+
+
+if __name__ == '__main__':
+    main()
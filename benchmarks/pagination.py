@@ -0,0 +1,90 @@
+"""Offset vs keyset page latency for GET /todos.
+
+Seeds a single user with enough todos to reach page 10,000 (limit 100)
+and times the query built by `paginate` at increasing page depths.
+
+Run against a throwaway database, tables are created and dropped:
+
+    DATABASE_URL=postgresql+psycopg://... python -m benchmarks.pagination
+"""
+
+import asyncio
+from statistics import median
+from time import perf_counter
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fast_api_exercise.models.user import Todo, table_registry
+from fast_api_exercise.pagination import encode_cursor, paginate
+from fast_api_exercise.schemas import FilterTodo
+from fast_api_exercise.settings import Settings
+
+LIMIT = 100
+PAGES = (1, 10, 100, 1_000, 10_000)
+RUNS = 5
+
+
+async def seed(conn, rows: int) -> None:
+    await conn.execute(
+        text(
+            'INSERT INTO users (username, email, password) '
+            "VALUES ('bench', 'bench@example.com', 'x')"
+        )
+    )
+    await conn.execute(
+        text(
+            'INSERT INTO todos (title, description, state, user_id) '
+            "SELECT 'todo ' || n, 'description', 'todo', 1 "
+            'FROM generate_series(1, :rows) AS n'
+        ),
+        {'rows': rows},
+    )
+    await conn.execute(text('ANALYZE todos'))
+
+
+async def time_page(conn, page: FilterTodo) -> float:
+    query = paginate(select(Todo).where(Todo.user_id == 1), Todo.id, page)
+    timings = []
+
+    for _ in range(RUNS):
+        start = perf_counter()
+        (await conn.execute(query)).all()
+        timings.append(perf_counter() - start)
+
+    return median(timings) * 1000
+
+
+async def main():
+    engine = create_async_engine(Settings().DATABASE_URL)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+        await seed(conn, max(PAGES) * LIMIT)
+
+    print(f'{"page":>7} {"offset ms":>10} {"cursor ms":>10}')
+
+    async with engine.connect() as conn:
+        for number in PAGES:
+            skipped = (number - 1) * LIMIT
+            # seeded ids are contiguous, so the cursor for a page is its
+            # first id minus one
+            offset = FilterTodo(offset=skipped, limit=LIMIT)
+            cursor = FilterTodo(
+                cursor=encode_cursor(skipped) if skipped else None,
+                limit=LIMIT,
+            )
+
+            print(
+                f'{number:>7} {await time_page(conn, offset):>10.2f} '
+                f'{await time_page(conn, cursor):>10.2f}'
+            )
+
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.drop_all)
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""Latency and peak memory of the list routes for 100 and 1000 row pages.
+
+Seeds `ROWS` users, and `ROWS` todos for the first of them, then times
+`GET /todos/` and `GET /users/` in-process through TestClient. Run
+against a throwaway database, tables are created and dropped:
+
+    DATABASE_URL=postgresql+psycopg://... python -m benchmarks.serialization
+"""
+
+import tracemalloc
+from statistics import mean
+from time import perf_counter
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from fast_api_exercise.app import app
+from fast_api_exercise.models.user import table_registry
+from fast_api_exercise.security import Principal, create_user_access_token
+from fast_api_exercise.settings import Settings
+
+ROWS = 1000
+PAGES = (100, 1000)
+REQUESTS = 200
+
+
+def main():
+    setup_engine = create_engine(Settings().DATABASE_URL)
+    table_registry.metadata.create_all(setup_engine)
+
+    with setup_engine.begin() as connection:
+        connection.execute(
+            text(
+                'INSERT INTO users (username, email, password) '
+                "SELECT 'user' || n, 'user' || n || '@b.com', 'x' "
+                'FROM generate_series(1, :rows) AS n'
+            ),
+            {'rows': ROWS},
+        )
+        connection.execute(
+            text(
+                'INSERT INTO todos (title, description, state, user_id) '
+                "SELECT 'todo ' || n, 'a description of todo ' || n, "
+                "'todo', 1 FROM generate_series(1, :rows) AS n"
+            ),
+            {'rows': ROWS},
+        )
+
+    token = create_user_access_token(Principal(1, 'user1@b.com', 0))
+    headers = {'Authorization': f'Bearer {token}'}
+
+    with TestClient(app) as client:
+        print(
+            f'{"route":<24} {"ms/request":>10} {"ms/row":>8} '
+            f'{"peak KiB":>9} {"KiB/row":>8}'
+        )
+
+        for route in ('/todos/', '/users/'):
+            for limit in PAGES:
+                timings = []
+
+                for _ in range(REQUESTS):
+                    start = perf_counter()
+                    response = client.get(
+                        f'{route}?limit={limit}', headers=headers
+                    )
+                    timings.append(perf_counter() - start)
+                    assert response.status_code == 200  # noqa: PLR2004
+
+                tracemalloc.start()
+                client.get(f'{route}?limit={limit}', headers=headers)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                latency = mean(timings) * 1000
+                peak /= 1024
+                print(
+                    f'{f"GET {route}?limit={limit}":<24} '
+                    f'{latency:>10.2f} {latency / limit:>8.4f} '
+                    f'{peak:>9.0f} {peak / limit:>8.2f}'
+                )
+
+    table_registry.metadata.drop_all(setup_engine)
+
+
+if __name__ == '__main__':
+    main()
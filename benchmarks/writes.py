@@ -0,0 +1,78 @@
+"""Latency and SQL statements per request of the todo/user write routes.
+
+Drives the app in-process through TestClient, counting the statements
+sent on its engine. Run against a throwaway database, tables are created
+and dropped:
+
+    DATABASE_URL=postgresql+psycopg://... python -m benchmarks.writes
+"""
+
+from statistics import mean
+from time import perf_counter
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+
+from fast_api_exercise.app import app
+from fast_api_exercise.models.user import table_registry
+from fast_api_exercise.settings import Settings
+
+REQUESTS = 500
+
+
+def measure(client, statements, request) -> tuple[float, float]:
+    timings = []
+    statements.clear()
+
+    for n in range(REQUESTS):
+        start = perf_counter()
+        response = request(client, n)
+        timings.append(perf_counter() - start)
+        assert response.status_code < 300, response.text  # noqa: PLR2004
+
+    return mean(timings) * 1000, len(statements) / REQUESTS
+
+
+def main():
+    setup_engine = create_engine(Settings().DATABASE_URL)
+    table_registry.metadata.create_all(setup_engine)
+    statements = []
+
+    with TestClient(app) as client:
+        event.listen(
+            app.state.engine.sync_engine,
+            'before_cursor_execute',
+            lambda *args: statements.append(args[2]),
+        )
+
+        client.post(
+            '/users/',
+            json={'username': 'bench', 'email': 'b@b.com', 'password': 'x'},
+        )
+        token = client.post(
+            '/auth/token', data={'username': 'b@b.com', 'password': 'x'}
+        ).json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+
+        routes = {
+            'POST /todos/': lambda c, n: c.post(
+                '/todos/',
+                headers=headers,
+                json={'title': f'todo {n}', 'description': 'bench'},
+            ),
+            'PATCH /todos/{id}': lambda c, n: c.patch(
+                f'/todos/{n + 1}', headers=headers, json={'state': 'done'}
+            ),
+        }
+
+        print(f'{"route":<20} {"ms/request":>10} {"statements":>10}')
+
+        for name, request in routes.items():
+            latency, per_request = measure(client, statements, request)
+            print(f'{name:<20} {latency:>10.2f} {per_request:>10.1f}')
+
+    table_registry.metadata.drop_all(setup_engine)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,52 @@
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
-from fast_api_exercise.routers import auth, todos, users
-from fast_api_exercise.settings import logger
+from fast_api_exercise.database import (
+    ReplicaRouter,
+    build_engine,
+    build_replica_engines,
+)
+from fast_api_exercise.events import todo_events
+from fast_api_exercise.hashing import password_hasher
+from fast_api_exercise.routers import auth, metrics, todos, users
+from fast_api_exercise.settings import Settings, logger
+from fast_api_exercise.trash import trash_purger
+from fast_api_exercise.write_behind import todo_write_behind
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info('Starting application')
+    settings = Settings()
+    app.state.engine = build_engine(settings)
+    app.state.replicas = ReplicaRouter(
+        app.state.engine,
+        build_replica_engines(settings),
+        settings.DATABASE_STICKY_PRIMARY_SECONDS,
+    )
+    password_hasher.start(
+        settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING
+    )
+    await todo_events.start(app.state.engine)
+    trash_purger.start(app.state.engine, settings)
+    await todo_write_behind.start(app.state.engine, settings)
+
     yield  # Executa a aplicação
+
+    await todo_write_behind.stop()
+    await trash_purger.stop()
+    await todo_events.stop()
+    password_hasher.shutdown()
+    await app.state.replicas.dispose()
+    await app.state.engine.dispose()
     logger.info('Stopping application')
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(todos.router)
+app.include_router(metrics.router)
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable
+
+from fast_api_exercise.metrics import metrics
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after `ttl` seconds.
+
+    Hits, misses and LRU evictions are exported as `<name>_*_total`
+    counters, plus a `<name>_size` gauge.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = Lock()
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+        metrics.gauge(f'{name}_size', self.__len__)
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+
+            if item is not None and item[0] <= monotonic():
+                del self._data[key]
+                item = None
+
+            if item is None:
+                metrics.inc(f'{self.name}_misses_total')
+                return None
+
+            self._data.move_to_end(key)
+
+        metrics.inc(f'{self.name}_hits_total')
+        return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        evicted = 0
+
+        with self._lock:
+            self._data[key] = (monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+
+        if evicted:
+            metrics.inc(f'{self.name}_evictions_total', evicted)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import Insert, Select, delete, insert, select, tuple_
+
+from fast_api_exercise.models.user import Todo, TodoTombstone
+
+# The longest a transaction writing todos may run. `updated_at` and
+# `deleted_at` are transaction start times, so a running transaction can
+# commit changes up to this far behind the newest ones already visible.
+CHANGES_SETTLE_SECONDS = 30
+# the most changes (and deletes) one call sends
+CHANGES_MAX_LIMIT = 1000
+
+
+def changed_todos(query: Select, since: tuple[datetime, int] | None) -> Select:
+    """Todos of `query` updated after the `(updated_at, id)` watermark.
+
+    Ordered by `(updated_at, id)` so `ix_todos_user_id_updated_at_id`
+    serves both the filter and the ordering.
+    """
+    if since:
+        query = query.where(tuple_(Todo.updated_at, Todo.id) > tuple_(*since))
+
+    return query.order_by(Todo.updated_at, Todo.id)
+
+
+def settled_watermark(
+    last_change: tuple[datetime, int], now: datetime
+) -> tuple[datetime, int]:
+    """The watermark of a page of changes ending at `last_change`.
+
+    It never passes `now - CHANGES_SETTLE_SECONDS`, where changes may still
+    be committing, so the next call sends the changes after it again and
+    clients (which apply them by id) never miss a late commit.
+    """
+    horizon = now - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+
+    return min(last_change, (horizon, 0))
+
+
+def deleted_todos(user_id: int, since: tuple[datetime, int]) -> Select:
+    return (
+        select(TodoTombstone.id, TodoTombstone.deleted_at)
+        .where(
+            TodoTombstone.user_id == user_id,
+            tuple_(TodoTombstone.deleted_at, TodoTombstone.id)
+            > tuple_(*since),
+        )
+        .order_by(TodoTombstone.deleted_at, TodoTombstone.id)
+    )
+
+
+def delete_todos(*conditions) -> Insert:
+    """DELETE the matching todos and record a tombstone for each of them.
+
+    A single statement (the DELETE runs in a CTE) returning the deleted
+    ids, so a delete can never lose its tombstone.
+    """
+    deleted = (
+        delete(Todo)
+        .where(*conditions)
+        .returning(Todo.id, Todo.user_id)
+        .cte('deleted')
+    )
+
+    return (
+        insert(TodoTombstone)
+        .from_select(
+            ['id', 'user_id'], select(deleted.c.id, deleted.c.user_id)
+        )
+        .returning(TodoTombstone.id)
+    )
@@ -1,11 +1,161 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+from itertools import cycle
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from fast_api_exercise.cache import TTLCache
+from fast_api_exercise.metrics import metrics
 from fast_api_exercise.settings import Settings
 
-engine = create_engine(Settings().DATABASE_URL)
+STICKY_CLIENTS_MAXSIZE = 10_000
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Records how long each checkout waits for a connection.
+
+    Sessions check out on first use, so requests that never touch the
+    database (a cached principal, say) never hold a connection.
+    """
+
+    def _do_get(self):
+        with metrics.timer(f'{self.logging_name}_pool_checkout_wait_seconds'):
+            return super()._do_get()
+
+
+def build_engine(
+    settings: Settings, url: str | None = None, name: str = 'db'
+) -> AsyncEngine:
+    engine = create_async_engine(
+        url or settings.DATABASE_URL,
+        poolclass=TimedQueuePool,
+        pool_logging_name=name,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+    )
+
+    pool = engine.pool
+    metrics.gauge(f'{name}_pool_size', pool.size)
+    metrics.gauge(f'{name}_pool_checked_out', pool.checkedout)
+    # QueuePool.overflow() is negative until pool_size connections exist
+    metrics.gauge(f'{name}_pool_overflow', lambda: max(pool.overflow(), 0))
+
+    return engine
+
+
+def build_replica_engines(settings: Settings) -> list[AsyncEngine]:
+    return [
+        build_engine(settings, url, f'db_replica{n}')
+        for n, url in enumerate(settings.DATABASE_REPLICA_URLS)
+    ]
+
+
+class ReplicaRouter:
+    """Picks the engine of read-only sessions: the replicas, round robin.
+
+    A client (its `Authorization` header) that committed a write on the
+    primary reads from the primary for `sticky_seconds`, so replication lag
+    never hides its own writes. Without replicas every read goes to the
+    primary.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: list[AsyncEngine],
+        sticky_seconds: float,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self._next_replica = cycle(replicas)
+        self._recent_writers = TTLCache(
+            name='db_sticky_clients',
+            maxsize=STICKY_CLIENTS_MAXSIZE,
+            ttl=sticky_seconds,
+        )
+
+    def wrote(self, client: str) -> None:
+        if self.replicas and self._recent_writers.ttl > 0:
+            self._recent_writers.set(client, True)
+
+    def read_engine(self, client: str | None) -> AsyncEngine:
+        if not self.replicas:
+            return self.primary
+
+        if client and self._recent_writers.get(client):
+            metrics.inc('db_sticky_primary_reads_total')
+            return self.primary
+
+        return next(self._next_replica)
+
+    async def dispose(self) -> None:
+        for engine in self.replicas:
+            await engine.dispose()
+
+
+def track_writes(session: AsyncSession, request: Request) -> None:
+    """Stick the request's client to the primary once `session` commits."""
+    session.info['replicas'] = request.app.state.replicas
+    session.info['client'] = request.headers.get('Authorization')
+
+
+@event.listens_for(Session, 'after_commit')
+def _stick_to_primary(session: Session) -> None:
+    replicas = session.info.get('replicas')
+    client = session.info.get('client')
+
+    if replicas and client:
+        replicas.wrote(client)
+
+
+@asynccontextmanager
+async def request_session(request: Request, engine: AsyncEngine):
+    """The request's session on `engine`, shared by its dependencies.
+
+    The first dependency asking for it opens it; a read routed to the
+    primary then reuses the connection authentication already holds.
+    """
+    if not hasattr(request.state, 'sessions'):
+        request.state.sessions = {}
+
+    sessions = request.state.sessions
+
+    if engine in sessions:
+        yield sessions[engine]
+        return
+
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        sessions[engine] = session
+        track_writes(session, request)
+
+        try:
+            yield session
+        finally:
+            del sessions[engine]
+
+
+async def get_session(request: Request):  # pragma: no cover
+    async with request_session(request, request.app.state.engine) as session:
+        yield session
+
+
+async def get_read_session(request: Request):
+    """A session for read-only routes, on a replica when there are any.
 
+    Authentication and every write keep using `get_session`.
+    """
+    replicas: ReplicaRouter = request.app.state.replicas
+    engine = replicas.read_engine(request.headers.get('Authorization'))
 
-def get_session():  # pragma: no cover
-    with Session(engine) as session:
+    async with request_session(request, engine) as session:
         yield session
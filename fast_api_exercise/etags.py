@@ -0,0 +1,74 @@
+import hashlib
+from collections.abc import Iterable
+from datetime import datetime
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import Header, HTTPException
+
+
+def updated_at_etag(updated_at: datetime) -> str:
+    return f'"{updated_at.isoformat()}"'
+
+
+def parse_updated_at_etag(etag: str) -> datetime | None:
+    """Return the `updated_at` encoded in a strong ETag, if it is one."""
+    etag = etag.strip()
+
+    if len(etag) < 2 or etag[0] != '"' or etag[-1] != '"':  # noqa: PLR2004
+        return None
+
+    try:
+        return datetime.fromisoformat(etag[1:-1])
+    except ValueError:
+        return None
+
+
+def weak_etag(updated_at: datetime | None) -> str:
+    last_update = updated_at.isoformat() if updated_at else ''
+
+    return f'W/"{last_update}"'
+
+
+def rows_etag(rows: Iterable) -> str:
+    """Weak ETag of a page of rows, from their `id` and `updated_at`.
+
+    Any insert, update or delete among the rows changes the hash, and so
+    does a row moving into or out of the page: a delete pulling in the
+    next row, or a patch moving a todo out of a state filter.
+    """
+    digest = hashlib.md5(usedforsecurity=False)
+
+    for row in rows:
+        digest.update(f'{row.id}:{row.updated_at.isoformat()},'.encode())
+
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison
+    if if_none_match.strip() == '*':
+        return True
+
+    candidates = (tag.strip() for tag in if_none_match.split(','))
+
+    return etag.removeprefix('W/') in {
+        tag.removeprefix('W/') for tag in candidates
+    }
+
+
+class ConditionalGet:
+    """Dependency answering `If-None-Match` requests with a 304.
+
+    Routes work out the ETag of what they would return, call `check` and
+    only then serialize it, setting the same ETag on the 200.
+    """
+
+    def __init__(self, if_none_match: Annotated[str | None, Header()] = None):
+        self.if_none_match = if_none_match
+
+    def check(self, etag: str) -> None:
+        if self.if_none_match and etag_matches(self.if_none_match, etag):
+            raise HTTPException(
+                status_code=HTTPStatus.NOT_MODIFIED, headers={'ETag': etag}
+            )
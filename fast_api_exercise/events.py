@@ -0,0 +1,154 @@
+import asyncio
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+
+import orjson
+import psycopg
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from fast_api_exercise.metrics import metrics
+from fast_api_exercise.models.user import TODO_EVENTS_CHANNEL
+from fast_api_exercise.settings import logger
+
+TODO_EVENTS_QUEUE_SIZE = 100
+TODO_EVENTS_KEEPALIVE_SECONDS = 15
+TODO_EVENTS_RETRY_SECONDS = 1
+
+
+class TodoEventHub:
+    """Fans todo change events out to the open streams of their user.
+
+    On PostgreSQL the triggers on `todos` `NOTIFY` every write (delivered
+    at commit) and every worker's `LISTEN` connection (see `start`) hands
+    the events to its own subscribers. On other dialects (SQLite in
+    development) events queued by the routes are published straight to
+    this process after the commit.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+        self._listener: asyncio.Task | None = None
+        self.listening = asyncio.Event()
+
+        metrics.gauge(
+            'todo_events_subscribers',
+            lambda: sum(map(len, self._subscribers.values())),
+        )
+
+    @contextmanager
+    def subscribe(self, user_id: int) -> Iterator[asyncio.Queue]:
+        queue = asyncio.Queue(TODO_EVENTS_QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+
+        try:
+            yield queue
+        finally:
+            self._subscribers[user_id].discard(queue)
+
+            if not self._subscribers[user_id]:
+                del self._subscribers[user_id]
+
+    def publish(self, todo_event: dict) -> None:
+        for queue in self._subscribers.get(todo_event['user_id'], ()):
+            try:
+                queue.put_nowait(todo_event)
+            except asyncio.QueueFull:
+                # a stalled client; it resyncs through /todos/changes
+                metrics.inc('todo_events_dropped_total')
+
+    async def start(self, engine: AsyncEngine) -> None:
+        if engine.dialect.name != 'postgresql':
+            return
+
+        url = engine.url.set(drivername='postgresql')
+        self._listener = asyncio.create_task(
+            self._listen(url.render_as_string(hide_password=False))
+        )
+
+    async def stop(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self, conninfo: str) -> None:
+        # a dedicated connection outside the pool, which it would pin
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    conninfo, autocommit=True
+                ) as connection:
+                    await connection.execute(f'LISTEN {TODO_EVENTS_CHANNEL}')
+                    self.listening.set()
+
+                    async for notify in connection.notifies():
+                        self.publish(orjson.loads(notify.payload))
+            except psycopg.Error as exc:
+                logger.error(f'Todo events listener failed - {exc}')
+            finally:
+                self.listening.clear()
+
+            await asyncio.sleep(TODO_EVENTS_RETRY_SECONDS)
+
+
+todo_events = TodoEventHub()
+
+
+def queue_todo_event(
+    session: AsyncSession, change: str, user_id: int, ids: Sequence[int]
+) -> None:
+    """Publish a `change` event for the todos `ids` once `session` commits.
+
+    `change` is `created` or `updated`. Only for dialects other than
+    PostgreSQL, where the triggers on `todos` send every event, `deleted`
+    ones of the trash purge included.
+    """
+    if ids and session.get_bind().dialect.name != 'postgresql':
+        session.info.setdefault('todo_events', []).append({
+            'type': change,
+            'user_id': user_id,
+            'ids': list(ids),
+        })
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_todo_events(session: Session) -> None:
+    for todo_event in session.info.pop('todo_events', ()):
+        todo_events.publish(todo_event)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_todo_events(session: Session) -> None:
+    session.info.pop('todo_events', None)
+
+
+def sse_message(todo_event: dict) -> bytes:
+    data = orjson.dumps({'ids': todo_event['ids']}).decode()
+
+    return f'event: {todo_event["type"]}\ndata: {data}\n\n'.encode()
+
+
+async def todo_event_stream(
+    user_id: int,
+    hub: TodoEventHub = todo_events,
+    keepalive: float = TODO_EVENTS_KEEPALIVE_SECONDS,
+):
+    """Server-sent events with the todo changes of `user_id`.
+
+    A comment goes out every `keepalive` idle seconds so proxies keep the
+    connection open.
+    """
+    with hub.subscribe(user_id) as queue:
+        yield b': connected\n\n'
+
+        while True:
+            try:
+                todo_event = await asyncio.wait_for(queue.get(), keepalive)
+            except TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+
+            yield sse_message(todo_event)
@@ -0,0 +1,74 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from pwdlib import PasswordHash
+
+from fast_api_exercise.metrics import metrics
+
+pwd_context = PasswordHash.recommended()
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """Runs argon2 in a process pool so it never blocks the event loop.
+
+    At most `max_pending` operations may be queued or running; beyond that
+    requests fail fast with 503 instead of piling up behind a login burst.
+    Until `start` is called (or with zero workers) hashing runs inline.
+    """
+
+    def __init__(self):
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self.max_pending = 0
+
+        metrics.gauge('password_hash_pending', lambda: self._pending)
+
+    def start(self, workers: int, max_pending: int) -> None:
+        if workers > 0:
+            # workers fork from a server that has already imported argon2
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=context
+            )
+        self.max_pending = max_pending
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+
+        if self._pending >= self.max_pending:
+            metrics.inc('password_hash_rejected_total')
+
+            raise HTTPException(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                detail='Server busy, try again later',
+                headers={'Retry-After': '1'},
+            )
+
+        self._pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,109 @@
+import codecs
+import csv
+from collections.abc import AsyncIterator, Sequence
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from fast_api_exercise.models.user import Todo
+from fast_api_exercise.schemas import TodoSchema
+
+# rows validated and loaded per COPY (or executemany)
+IMPORT_BATCH_SIZE = 1000
+
+# per-row errors listed in the response, further failures are only counted
+IMPORT_MAX_ERRORS = 100
+
+IMPORT_COLUMNS = ('title', 'description', 'state', 'user_id')
+
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+
+        for line in lines:
+            yield line + '\n'
+
+    pending += decoder.decode(b'', final=True)
+
+    if pending:
+        yield pending
+
+
+async def read_records(
+    chunks: AsyncIterator[bytes], format: str
+) -> AsyncIterator[str]:
+    """Split a streamed body into records, skipping blank lines.
+
+    A CSV record spans several lines while a quoted field is open, which
+    is the case as long as it holds an odd number of quotes.
+    """
+    record = ''
+
+    async for line in read_lines(chunks):
+        record += line
+
+        if format == 'csv' and record.count('"') % 2:
+            continue
+
+        if record.strip():
+            yield record
+
+        record = ''
+
+    if record.strip():
+        yield record
+
+
+def read_csv_record(record: str) -> list[str]:
+    return next(csv.reader([record]))
+
+
+def validate_record(
+    record: str, format: str, header: Sequence[str] | None
+) -> TodoSchema:
+    if format == 'csv':
+        return TodoSchema.model_validate(
+            dict(zip(header, read_csv_record(record)))
+        )
+
+    return TodoSchema.model_validate_json(record)
+
+
+async def copy_todos(session: AsyncSession, rows: list[tuple]) -> None:
+    """Load `rows` (in `IMPORT_COLUMNS` order) in the session transaction.
+
+    PostgreSQL gets a single COPY; other dialects fall back to an
+    executemany INSERT.
+    """
+    connection = await session.connection()
+
+    if connection.dialect.name != 'postgresql':
+        await session.execute(
+            insert(Todo), [dict(zip(IMPORT_COLUMNS, row)) for row in rows]
+        )
+        return
+
+    raw_connection = await connection.get_raw_connection()
+    columns = ', '.join(IMPORT_COLUMNS)
+
+    async with raw_connection.driver_connection.cursor() as cursor:
+        async with cursor.copy(
+            f'COPY {Todo.__tablename__} ({columns}) FROM STDIN'
+        ) as copy:
+            for row in rows:
+                await copy.write_row(row)
+
+
+def row_errors(row: int, exc: ValidationError) -> dict:
+    return {
+        'row': row,
+        'errors': exc.errors(
+            include_url=False, include_context=False, include_input=False
+        ),
+    }
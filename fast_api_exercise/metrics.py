@@ -0,0 +1,53 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Callable
+
+
+class MetricsRegistry:
+    """In-process counters and gauges rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, Callable[[], float]] = {}
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self._counters[f'{name}_count'] += 1
+            self._counters[f'{name}_sum'] += value
+
+    @contextmanager
+    def timer(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start)
+
+    def gauge(self, name: str, func: Callable[[], float]) -> None:
+        self._gauges[name] = func
+
+    def value(self, name: str) -> float:
+        if name in self._gauges:
+            return self._gauges[name]()
+
+        return self._counters.get(name, 0.0)
+
+    def render(self) -> str:
+        with self._lock:
+            samples = dict(self._counters)
+
+        samples.update({name: func() for name, func in self._gauges.items()})
+
+        return ''.join(
+            f'{name} {value}\n' for name, value in sorted(samples.items())
+        )
+
+
+metrics = MetricsRegistry()
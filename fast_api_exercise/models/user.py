@@ -1,11 +1,23 @@
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import (
+    DDL,
+    ForeignKey,
+    Index,
+    PrimaryKeyConstraint,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import to_tsvector
 from sqlalchemy.orm import Mapped, mapped_column, registry, relationship
 
 table_registry = registry()
 
+# hash partitions of `todos`, by user_id
+TODO_PARTITIONS = 16
+
 
 class TodoState(str, Enum):
     draft = 'draft'
@@ -18,11 +30,16 @@ class TodoState(str, Enum):
 @table_registry.mapped_as_dataclass
 class User:
     __tablename__ = 'users'
+    # fetch server defaults with RETURNING instead of a refresh SELECT
+    __mapper_args__ = {'eager_defaults': True}
 
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
     username: Mapped[str] = mapped_column(unique=True)
     password: Mapped[str]
     email: Mapped[str] = mapped_column(unique=True)
+    token_version: Mapped[int] = mapped_column(
+        init=False, default=0, server_default='0'
+    )
     created_at: Mapped[datetime] = mapped_column(
         init=False, server_default=func.now()
     )
@@ -30,20 +47,54 @@ class User:
         init=False, server_default=func.now(), onupdate=func.now()
     )
 
+    # a user can have a great many todos: they're never loaded along with
+    # it, and deleting it leaves them to the ON DELETE CASCADE of the
+    # foreign key instead of loading and deleting them one by one
     todos: Mapped[list['Todo']] = relationship(
-        init=False, back_populates='user', cascade='all, delete-orphan'
+        init=False,
+        back_populates='user',
+        cascade='all, delete-orphan',
+        passive_deletes=True,
+        lazy='raise',
+        repr=False,
     )
 
 
 @table_registry.mapped_as_dataclass
 class Todo:
     __tablename__ = 'todos'
+    # every todo query is scoped by user_id and paginated by id
+    __table_args__ = (
+        Index('ix_todos_user_id_id', 'user_id', 'id'),
+        Index('ix_todos_user_id_state_id', 'user_id', 'state', 'id'),
+        Index('ix_todos_user_id_updated_at_id', 'user_id', 'updated_at', 'id'),
+        # the purge scans the trash alone, oldest first
+        Index(
+            'ix_todos_trash_updated_at',
+            'updated_at',
+            postgresql_where=text("state = 'trash'"),
+        ),
+        # the primary key of a partitioned table must hold the partition
+        # key: on PostgreSQL it's (id, user_id), added after the CREATE
+        # TABLE below. The sequence keeps the id alone unique
+        PrimaryKeyConstraint('id', name='todos_pkey').ddl_if(
+            callable_=lambda *args, dialect, **kw: (
+                dialect.name != 'postgresql'
+            )
+        ),
+        # vacuum and index upkeep work per partition, and queries scoped
+        # by user_id only read that user's partition
+        {'postgresql_partition_by': 'HASH (user_id)'},
+    )
+    __mapper_args__ = {'eager_defaults': True}
 
     id: Mapped[int] = mapped_column(init=False, primary_key=True)
     title: Mapped[str]
     description: Mapped[str]
 
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='CASCADE')
+    )
 
     state: Mapped[TodoState] = mapped_column(default=TodoState.draft)
     created_at: Mapped[datetime] = mapped_column(
@@ -54,3 +105,210 @@ class Todo:
     )
 
     user: Mapped[User] = relationship(init=False, back_populates='todos')
+
+
+@table_registry.mapped_as_dataclass
+class TodoTombstone:
+    """A deleted todo, kept so `/todos/changes` can report the delete."""
+
+    __tablename__ = 'todo_tombstones'
+    __table_args__ = (
+        Index(
+            'ix_todo_tombstones_user_id_deleted_at_id',
+            'user_id',
+            'deleted_at',
+            'id',
+        ),
+    )
+
+    # the id the todo had
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='CASCADE')
+    )
+    deleted_at: Mapped[datetime] = mapped_column(
+        init=False, server_default=func.now()
+    )
+
+
+@table_registry.mapped_as_dataclass
+class TodoCounter:
+    """How many todos a user has in a state, kept by triggers on `todos`."""
+
+    __tablename__ = 'todo_counters'
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='CASCADE'), primary_key=True
+    )
+    state: Mapped[TodoState] = mapped_column(primary_key=True)
+    count: Mapped[int] = mapped_column(default=0, server_default='0')
+
+
+# Statement-level triggers: a bulk write or a COPY updates each counter
+# row once, and updates that keep the state (HAVING) don't touch them.
+# Deletes only decrement, as a user delete cascades to both tables.
+TODO_COUNTERS_FUNCTION = """
+CREATE OR REPLACE FUNCTION todo_counters_refresh() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO todo_counters (user_id, state, count)
+        SELECT user_id, state, count(*) FROM new_todos
+        GROUP BY user_id, state
+        ORDER BY user_id, state
+        ON CONFLICT (user_id, state)
+        DO UPDATE SET count = todo_counters.count + excluded.count;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO todo_counters (user_id, state, count)
+        SELECT user_id, state, sum(delta) FROM (
+            SELECT user_id, state, 1 AS delta FROM new_todos
+            UNION ALL
+            SELECT user_id, state, -1 FROM old_todos
+        ) AS changes
+        GROUP BY user_id, state
+        HAVING sum(delta) <> 0
+        ORDER BY user_id, state
+        ON CONFLICT (user_id, state)
+        DO UPDATE SET count = todo_counters.count + excluded.count;
+    ELSE
+        UPDATE todo_counters SET count = todo_counters.count - deleted.count
+        FROM (
+            SELECT user_id, state, count(*) AS count FROM old_todos
+            GROUP BY user_id, state
+        ) AS deleted
+        WHERE todo_counters.user_id = deleted.user_id
+            AND todo_counters.state = deleted.state;
+    END IF;
+
+    RETURN NULL;
+END
+$$
+"""
+TODO_COUNTERS_TRIGGERS = {
+    'insert': 'NEW TABLE AS new_todos',
+    'update': 'OLD TABLE AS old_todos NEW TABLE AS new_todos',
+    'delete': 'OLD TABLE AS old_todos',
+}
+
+TODO_EVENTS_CHANNEL = 'todo_events'
+# NOTIFY payloads must stay under 8000 bytes
+NOTIFY_MAX_IDS = 500
+
+# Statement-level too, on the transition tables of the counter triggers:
+# one NOTIFY per user (and NOTIFY_MAX_IDS ids) a write touched, sent by
+# the write itself instead of a statement of its own. Deletes cascading
+# from a deleted user send nothing, nobody is left to hear about them.
+TODO_EVENTS_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION todo_events_notify() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    user_ids integer[];
+    ids integer[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(user_id), array_agg(id) INTO user_ids, ids
+        FROM old_todos
+        WHERE EXISTS (SELECT FROM users WHERE users.id = old_todos.user_id);
+    ELSE
+        SELECT array_agg(user_id), array_agg(id) INTO user_ids, ids
+        FROM new_todos;
+    END IF;
+
+    PERFORM pg_notify('{TODO_EVENTS_CHANNEL}', json_build_object(
+        'type', CASE TG_OP
+            WHEN 'INSERT' THEN 'created'
+            WHEN 'UPDATE' THEN 'updated'
+            ELSE 'deleted'
+        END,
+        'user_id', user_id,
+        'ids', json_agg(id ORDER BY id)
+    )::text)
+    FROM (
+        SELECT user_id, id, (
+            row_number() OVER (PARTITION BY user_id ORDER BY id) - 1
+        ) / {NOTIFY_MAX_IDS} AS chunk
+        FROM unnest(user_ids, ids) AS changes (user_id, id)
+    ) AS changes
+    GROUP BY user_id, chunk
+    ORDER BY user_id, chunk;
+
+    RETURN NULL;
+END
+$$
+"""
+
+event.listen(
+    Todo.__table__,
+    'after_create',
+    DDL(
+        'ALTER TABLE todos ADD CONSTRAINT todos_pkey PRIMARY KEY (id, user_id)'
+    ).execute_if(dialect='postgresql'),
+)
+
+for remainder in range(TODO_PARTITIONS):
+    event.listen(
+        Todo.__table__,
+        'after_create',
+        DDL(
+            f'CREATE TABLE todos_p{remainder} PARTITION OF todos '
+            f'FOR VALUES WITH (MODULUS {TODO_PARTITIONS}, '
+            f'REMAINDER {remainder})'
+        ).execute_if(dialect='postgresql'),
+    )
+
+event.listen(
+    Todo.__table__,
+    'after_create',
+    DDL(TODO_COUNTERS_FUNCTION).execute_if(dialect='postgresql'),
+)
+
+for operation, transition_tables in TODO_COUNTERS_TRIGGERS.items():
+    event.listen(
+        Todo.__table__,
+        'after_create',
+        DDL(
+            f'CREATE TRIGGER todo_counters_{operation} '
+            f'AFTER {operation.upper()} ON todos '
+            f'REFERENCING {transition_tables} '
+            'FOR EACH STATEMENT EXECUTE FUNCTION todo_counters_refresh()'
+        ).execute_if(dialect='postgresql'),
+    )
+
+event.listen(
+    Todo.__table__,
+    'after_create',
+    DDL(TODO_EVENTS_FUNCTION).execute_if(dialect='postgresql'),
+)
+
+for operation, transition_tables in TODO_COUNTERS_TRIGGERS.items():
+    event.listen(
+        Todo.__table__,
+        'after_create',
+        DDL(
+            f'CREATE TRIGGER todo_events_{operation} '
+            f'AFTER {operation.upper()} ON todos '
+            f'REFERENCING {transition_tables} '
+            'FOR EACH STATEMENT EXECUTE FUNCTION todo_events_notify()'
+        ).execute_if(dialect='postgresql'),
+    )
+
+for function in ('todo_counters_refresh', 'todo_events_notify'):
+    event.listen(
+        Todo.__table__,
+        'after_drop',
+        DDL(f'DROP FUNCTION IF EXISTS {function}()').execute_if(
+            dialect='postgresql'
+        ),
+    )
+
+
+# Full-text document of a todo. Config and separator are SQL literals so
+# queries produce exactly the expression of the GIN index below.
+TODO_SEARCH_CONFIG = text("'simple'::regconfig")
+todo_search_vector = to_tsvector(
+    TODO_SEARCH_CONFIG, Todo.title + text("' '") + Todo.description
+)
+
+Index('ix_todos_search', todo_search_vector, postgresql_using='gin').ddl_if(
+    dialect='postgresql'
+)
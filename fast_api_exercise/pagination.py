@@ -0,0 +1,64 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from sqlalchemy import Select
+from sqlalchemy.orm import InstrumentedAttribute
+
+
+def encode_cursor(last_id: int) -> str:
+    return urlsafe_b64encode(json.dumps({'id': last_id}).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        last_id = json.loads(urlsafe_b64decode(cursor.encode()))['id']
+    except (ValueError, TypeError, KeyError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+    if not isinstance(last_id, int):
+        raise ValueError('Invalid cursor')
+
+    return last_id
+
+
+def encode_watermark(changed_at: datetime, last_id: int) -> str:
+    return urlsafe_b64encode(
+        json.dumps({'at': changed_at.isoformat(), 'id': last_id}).encode()
+    ).decode()
+
+
+def decode_watermark(watermark: str) -> tuple[datetime, int]:
+    try:
+        data = json.loads(urlsafe_b64decode(watermark.encode()))
+        changed_at, last_id = datetime.fromisoformat(data['at']), data['id']
+    except (ValueError, TypeError, KeyError) as exc:
+        raise ValueError('Invalid watermark') from exc
+
+    if not isinstance(last_id, int):
+        raise ValueError('Invalid watermark')
+
+    return changed_at, last_id
+
+
+def paginate(query: Select, key: InstrumentedAttribute, page) -> Select:
+    """Order by `key` and apply keyset paging when a cursor is given.
+
+    Without a cursor the legacy offset paging is used, so existing
+    clients keep working; both modes return a `next_cursor`.
+    """
+    query = query.order_by(key)
+
+    if page.cursor:
+        query = query.where(key > decode_cursor(page.cursor))
+    else:
+        query = query.offset(page.offset)
+
+    return query.limit(page.limit)
+
+
+def next_cursor(rows, page) -> str | None:
+    if rows and len(rows) == page.limit:
+        return encode_cursor(rows[-1].id)
+
+    return None
@@ -4,14 +4,15 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from fast_api_exercise.database import get_session
 from fast_api_exercise.models.user import User
 from fast_api_exercise.schemas import Token
 from fast_api_exercise.security import (
-    create_access_token,
-    get_current_user,
+    Principal,
+    create_user_access_token,
+    get_current_principal,
     verify_password,
 )
 from fast_api_exercise.settings import logger
@@ -19,15 +20,17 @@ from fast_api_exercise.settings import logger
 router = APIRouter(prefix='/auth', tags=['auth'])
 
 T_OAuth2Form = Annotated[OAuth2PasswordRequestForm, Depends()]
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_session)]
+T_CurrentUser = Annotated[Principal, Depends(get_current_principal)]
 
 
 @router.post('/token', response_model=Token)
-def login_for_access_token(form_data: T_OAuth2Form, session: T_Session):
+async def login_for_access_token(form_data: T_OAuth2Form, session: T_Session):
     logger.info('Starting user login')
 
-    user = session.scalar(select(User).where(User.email == form_data.username))
+    user = await session.scalar(
+        select(User).where(User.email == form_data.username)
+    )
 
     if not user:
         logger.error('Incorrect email or password')
@@ -37,7 +40,7 @@ def login_for_access_token(form_data: T_OAuth2Form, session: T_Session):
             detail='Incorrect email or password',
         )
 
-    if not verify_password(form_data.password, user.password):
+    if not await verify_password(form_data.password, user.password):
         logger.error('Incorrect email or password')
 
         raise HTTPException(
@@ -45,15 +48,15 @@ def login_for_access_token(form_data: T_OAuth2Form, session: T_Session):
             detail='Incorrect email or password',
         )
 
-    access_token = create_access_token(data={'sub': user.email})
+    access_token = create_user_access_token(user)
 
     return {'access_token': access_token, 'token_type': 'bearer'}
 
 
 @router.post('/refresh_token', response_model=Token)
-def refresh_access_token(user: T_CurrentUser):
+async def refresh_access_token(user: T_CurrentUser):
     logger.info('Starting token refresh')
 
-    new_access_token = create_access_token(data={'sub': user.email})
+    new_access_token = create_user_access_token(user)
 
     return {'access_token': new_access_token, 'token_type': 'bearer'}
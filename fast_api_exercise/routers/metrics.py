@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from fast_api_exercise.metrics import metrics
+
+router = APIRouter(tags=['metrics'])
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def read_metrics():
+    return metrics.render()
@@ -1,32 +1,111 @@
 from http import HTTPStatus
+from time import perf_counter
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import (
+    Integer,
+    Select,
+    String,
+    any_,
+    bindparam,
+    cast,
+    column,
+    func,
+    insert,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fast_api_exercise.database import get_session
-from fast_api_exercise.models.user import Todo, User
+from fast_api_exercise.changes import (
+    changed_todos,
+    deleted_todos,
+    settled_watermark,
+)
+from fast_api_exercise.database import get_read_session, get_session
+from fast_api_exercise.etags import (
+    ConditionalGet,
+    parse_updated_at_etag,
+    rows_etag,
+    updated_at_etag,
+)
+from fast_api_exercise.events import queue_todo_event, todo_event_stream
+from fast_api_exercise.export import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_MEDIA_TYPES,
+    export_chunks,
+)
+from fast_api_exercise.importer import (
+    IMPORT_BATCH_SIZE,
+    IMPORT_MAX_ERRORS,
+    copy_todos,
+    read_csv_record,
+    read_records,
+    row_errors,
+    validate_record,
+)
+from fast_api_exercise.models.user import Todo, TodoCounter, TodoState
+from fast_api_exercise.pagination import (
+    decode_watermark,
+    encode_watermark,
+    next_cursor,
+    paginate,
+)
 from fast_api_exercise.schemas import (
+    FilterChanges,
     FilterTodo,
     Message,
+    TodoBulkResults,
+    TodoBulkUpdate,
+    TodoChanges,
+    TodoExport,
+    TodoFilters,
+    TodoImport,
+    TodoImportResult,
     TodoList,
     TodoPublic,
     TodoSchema,
+    TodoStats,
     TodoUpdate,
 )
-from fast_api_exercise.security import get_current_user
+from fast_api_exercise.search import check_search_dialect, search_todos
+from fast_api_exercise.security import Principal, get_current_principal
+from fast_api_exercise.serialization import (
+    dump_rows,
+    select_columns,
+    with_id,
+)
 from fast_api_exercise.settings import logger
+from fast_api_exercise.trash import trash_todos
+from fast_api_exercise.write_behind import todo_write_behind
 
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_session)]
+T_ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
+T_CurrentUser = Annotated[Principal, Depends(get_current_principal)]
 T_filter = Annotated[FilterTodo, Query()]
+T_Conditional = Annotated[ConditionalGet, Depends()]
+
+BULK_MAX_ITEMS = 1000
 
 router = APIRouter(prefix='/todos', tags=['todos'])
 
 
 @router.post('/', response_model=TodoPublic)
-def create_todo(
+async def create_todo(
     todo: TodoSchema,
     user: T_CurrentUser,
     session: T_Session,
@@ -41,22 +120,14 @@ def create_todo(
     )
 
     session.add(db_todo)
-    session.commit()
-    session.refresh(db_todo)
+    await session.flush()
+    queue_todo_event(session, 'created', user.id, [db_todo.id])
+    await session.commit()
 
     return db_todo
 
 
-@router.get('/', response_model=TodoList)
-def get_todos(
-    session: T_Session,
-    todo_filter: T_filter,
-    user: T_CurrentUser,
-):
-    logger.debug(f'Starting todo listing - {todo_filter}')
-
-    query = select(Todo).where(Todo.user_id == user.id)
-
+def filter_todos(query: Select, todo_filter: TodoFilters) -> Select:
     if todo_filter.title:
         query = query.filter(Todo.title.contains(todo_filter.title))
 
@@ -67,60 +138,478 @@ def get_todos(
 
     if todo_filter.state:
         query = query.filter(Todo.state == todo_filter.state)
+    else:
+        # trashed todos are only listed when asked for
+        query = query.filter(Todo.state != TodoState.trash)
+
+    return query
+
+
+@router.get('/', response_model=TodoList)
+async def get_todos(
+    session: T_ReadSession,
+    todo_filter: T_filter,
+    user: T_CurrentUser,
+    conditional: T_Conditional,
+):
+    logger.debug(f'Starting todo listing - {todo_filter}')
+
+    fields = todo_filter.field_names
+    # the ETag is hashed from the ids and versions of the rows sent
+    columns = dict.fromkeys([*with_id(fields), 'updated_at'])
+    query = filter_todos(
+        select(*select_columns(Todo, list(columns))).where(
+            Todo.user_id == user.id
+        ),
+        todo_filter,
+    )
+
+    if todo_filter.search:
+        check_search_dialect(session.get_bind())
+        query = (
+            search_todos(query, todo_filter.search)
+            .offset(todo_filter.offset)
+            .limit(todo_filter.limit)
+        )
+    else:
+        query = paginate(query, Todo.id, todo_filter)
+
+    todos = await session.execute(query)
+    todos = todos.all()
+    etag = rows_etag(todos)
+    conditional.check(etag)
+
+    return ORJSONResponse(
+        {
+            'todos': dump_rows(todos, fields),
+            'next_cursor': None
+            if todo_filter.search
+            else next_cursor(todos, todo_filter),
+        },
+        headers={'ETag': etag},
+    )
+
+
+@router.get('/changes', response_model=TodoChanges)
+async def get_todo_changes(
+    session: T_Session,
+    changes_filter: Annotated[FilterChanges, Query()],
+    user: T_CurrentUser,
+):
+    logger.debug(f'Starting todo changes listing - {changes_filter}')
+
+    # Without `since` every todo is returned, and no deletes. Clients pass
+    # `watermark` back as `since`, right away while `has_more` is true.
+    # Changes of the last CHANGES_SETTLE_SECONDS come again on the next call.
+
+    fields = tuple(TodoPublic.model_fields)
+    limit = changes_filter.limit
+    since = changes_filter.since and decode_watermark(changes_filter.since)
+    now = await session.scalar(select(func.localtimestamp()))
+
+    todos = await session.execute(
+        changed_todos(
+            select(*select_columns(Todo, fields)).where(
+                Todo.user_id == user.id
+            ),
+            since,
+        ).limit(limit + 1)
+    )
+    changes = [(todo.updated_at, todo.id, todo) for todo in todos]
+
+    if since:
+        deleted = await session.execute(
+            deleted_todos(user.id, since).limit(limit + 1)
+        )
+        changes += [(todo.deleted_at, todo.id, None) for todo in deleted]
+
+    changes.sort(key=lambda change: change[:2])
+    page = changes[:limit]
+    watermark = page and settled_watermark(page[-1][:2], now)
+
+    return ORJSONResponse({
+        'todos': dump_rows(
+            (todo for *_, todo in page if todo is not None), fields
+        ),
+        'deleted': [todo_id for _, todo_id, todo in page if todo is None],
+        'watermark': encode_watermark(*watermark)
+        if page
+        else changes_filter.since,
+        # what follows a page held back by the settle window is unsettled
+        # too: it comes once that page settles, not right away
+        'has_more': len(changes) > limit and watermark == page[-1][:2],
+    })
+
+
+@router.get('/stats', response_model=TodoStats)
+async def get_todo_stats(session: T_Session, user: T_CurrentUser):
+    logger.debug(f'Starting todo stats - {user.id}')
+
+    # one counter row per state, whatever the number of todos
+    counts = dict(
+        (
+            await session.execute(
+                select(TodoCounter.state, TodoCounter.count).where(
+                    TodoCounter.user_id == user.id
+                )
+            )
+        ).all()
+    )
+    states = {state.value: counts.get(state, 0) for state in TodoState}
+
+    return {'states': states, 'total': sum(states.values())}
+
+
+@router.get('/events')
+async def stream_todo_events(user: T_CurrentUser, session: T_Session):
+    logger.debug(f'Starting todo events stream - {user.id}')
+
+    # the stream outlives the request's dependencies; don't pin a pooled
+    # connection for as long as the client stays subscribed
+    await session.close()
+
+    return StreamingResponse(
+        todo_event_stream(user.id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@router.get('/export')
+async def export_todos(
+    session: T_Session,
+    todo_export: Annotated[TodoExport, Query()],
+    user: T_CurrentUser,
+):
+    logger.debug(f'Starting todo export - {todo_export}')
+
+    fields = list(TodoPublic.model_fields)
+    query = filter_todos(
+        select(*select_columns(Todo, fields)).where(Todo.user_id == user.id),
+        todo_export,
+    )
+
+    if todo_export.search:
+        check_search_dialect(session.get_bind())
+        query = search_todos(query, todo_export.search)
+    else:
+        query = query.order_by(Todo.id)
+
+    result = await session.stream(
+        query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    return StreamingResponse(
+        export_chunks(result, fields, todo_export.format),
+        media_type=EXPORT_MEDIA_TYPES[todo_export.format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="todos.{todo_export.format}"'
+            )
+        },
+    )
+
+
+@router.post('/import', response_model=TodoImportResult)
+async def import_todos(
+    request: Request,
+    session: T_Session,
+    todo_import: Annotated[TodoImport, Query()],
+    user: T_CurrentUser,
+):
+    logger.debug(f'Starting todo import - {todo_import}')
+
+    start = perf_counter()
+    imported = failed = row = 0
+    errors = []
+    header = None
+    batch = []
+
+    async for record in read_records(request.stream(), todo_import.format):
+        if todo_import.format == 'csv' and header is None:
+            header = read_csv_record(record)
+            continue
 
-    todos = session.scalars(
-        query.offset(todo_filter.offset).limit(todo_filter.limit)
-    ).all()
+        row += 1
 
-    return {'todos': todos}
+        try:
+            todo = validate_record(record, todo_import.format, header)
+        except ValidationError as exc:
+            failed += 1
 
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append(row_errors(row, exc))
 
-@router.patch('/{todo_id}', response_model=TodoUpdate)
-def patch_todo(
+            continue
+
+        batch.append((todo.title, todo.description, TodoState.draft, user.id))
+
+        if len(batch) == IMPORT_BATCH_SIZE:
+            await copy_todos(session, batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        await copy_todos(session, batch)
+        imported += len(batch)
+
+    await session.commit()
+
+    seconds = perf_counter() - start
+    logger.info(f'Todos imported - {imported} imported - {failed} failed')
+
+    return {
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+        'seconds': seconds,
+        'rows_per_second': (imported + failed) / seconds,
+    }
+
+
+@router.post(
+    '/bulk', status_code=HTTPStatus.CREATED, response_model=TodoBulkResults
+)
+async def create_todos_bulk(
+    todos: Annotated[list[TodoSchema], Body(max_length=BULK_MAX_ITEMS)],
+    user: T_CurrentUser,
+    session: T_Session,
+):
+    logger.debug(f'Starting bulk todo creation - {len(todos)} todos')
+
+    if not todos:
+        return {'results': []}
+
+    db_todos = await session.scalars(
+        insert(Todo).returning(Todo, sort_by_parameter_order=True),
+        [{**todo.model_dump(), 'user_id': user.id} for todo in todos],
+    )
+    db_todos = db_todos.all()
+    queue_todo_event(
+        session, 'created', user.id, [todo.id for todo in db_todos]
+    )
+    await session.commit()
+
+    return {
+        'results': [
+            {'id': todo.id, 'status': HTTPStatus.CREATED, 'todo': todo}
+            for todo in db_todos
+        ]
+    }
+
+
+@router.patch('/bulk', response_model=TodoBulkResults)
+async def patch_todos_bulk(
+    todos: Annotated[list[TodoBulkUpdate], Body(max_length=BULK_MAX_ITEMS)],
+    session: T_Session,
+    user: T_CurrentUser,
+):
+    logger.debug(f'Starting bulk todo update - {len(todos)} todos')
+
+    ids = [todo.id for todo in todos]
+
+    if len(set(ids)) != len(ids):
+        logger.error('Duplicate todo ids in bulk update')
+
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail='Duplicate todo ids.',
+        )
+
+    if not todos:
+        return {'results': []}
+
+    await todo_write_behind.discard(user.id, ids)
+
+    # A single UPDATE ... FROM (VALUES ...); unset fields come through as
+    # NULL and keep the current value
+    changes = values(
+        column('id', Integer),
+        column('title', String),
+        column('description', String),
+        column('state', Todo.state.type),
+        name='changes',
+    ).data([
+        (todo.id, todo.title, todo.description, todo.state) for todo in todos
+    ])
+
+    db_todos = await session.scalars(
+        update(Todo)
+        .where(Todo.id == changes.c.id, Todo.user_id == user.id)
+        .values(
+            title=func.coalesce(changes.c.title, Todo.title),
+            description=func.coalesce(changes.c.description, Todo.description),
+            state=func.coalesce(
+                cast(changes.c.state, Todo.state.type), Todo.state
+            ),
+        )
+        .returning(Todo)
+        .execution_options(populate_existing=True)
+    )
+    updated = {todo.id: todo for todo in db_todos}
+    queue_todo_event(session, 'updated', user.id, list(updated))
+    await session.commit()
+
+    return {
+        'results': [
+            {'id': todo_id, 'status': HTTPStatus.OK, 'todo': updated[todo_id]}
+            if todo_id in updated
+            else {'id': todo_id, 'status': HTTPStatus.NOT_FOUND}
+            for todo_id in ids
+        ]
+    }
+
+
+@router.delete('/bulk', response_model=TodoBulkResults)
+async def delete_todos_bulk(
+    ids: Annotated[list[int], Query(max_length=BULK_MAX_ITEMS)],
+    session: T_Session,
+    user: T_CurrentUser,
+):
+    logger.debug(f'Starting bulk todo deletion - {ids}')
+
+    deleted = await session.scalars(
+        trash_todos(
+            Todo.user_id == user.id,
+            Todo.id == any_(bindparam('ids', ids, type_=ARRAY(Integer))),
+        )
+    )
+    deleted = set(deleted)
+    queue_todo_event(session, 'updated', user.id, list(deleted))
+    await session.commit()
+
+    return {
+        'results': [
+            {
+                'id': todo_id,
+                'status': HTTPStatus.OK
+                if todo_id in deleted
+                else HTTPStatus.NOT_FOUND,
+            }
+            for todo_id in ids
+        ]
+    }
+
+
+async def todo_precondition_failed(
+    session: AsyncSession, user_id: int, todo_id: int, if_match: str | None
+) -> HTTPException:
+    """Tell apart a missing todo from a failed If-Match after 0 rows."""
+    if if_match and await session.scalar(
+        select(Todo.id).where(Todo.user_id == user_id, Todo.id == todo_id)
+    ):
+        logger.error(f'Todo precondition failed - {todo_id}')
+
+        return HTTPException(
+            status_code=HTTPStatus.PRECONDITION_FAILED,
+            detail='Todo has been modified.',
+        )
+
+    logger.error(f'Todo not found - {todo_id}')
+
+    return HTTPException(
+        status_code=HTTPStatus.NOT_FOUND, detail='Todo not found.'
+    )
+
+
+def todo_conditions(user_id: int, todo_id: int, if_match: str | None):
+    conditions = [Todo.user_id == user_id, Todo.id == todo_id]
+
+    if if_match and if_match.strip() != '*':
+        conditions.append(Todo.updated_at == parse_updated_at_etag(if_match))
+
+    return conditions
+
+
+def deferrable(
+    changes: dict, prefer: str | None, if_match: str | None
+) -> bool:
+    """A state flip the client lets us acknowledge before it's written."""
+    return (
+        prefer is not None
+        and 'respond-async' in prefer
+        and not if_match
+        and changes.keys() == {'state'}
+        and changes['state'] not in {None, TodoState.trash}
+    )
+
+
+@router.patch(
+    '/{todo_id}',
+    response_model=TodoUpdate,
+    responses={HTTPStatus.ACCEPTED: {'model': Message}},
+)
+async def patch_todo(  # noqa: PLR0913, PLR0917
     todo_id: int,
     todo: TodoUpdate,
     session: T_Session,
     user: T_CurrentUser,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
+    prefer: Annotated[str | None, Header()] = None,
 ):
     logger.debug(f'Starting todo update - {todo_id} - {todo}')
 
-    db_todo = session.scalar(
-        select(Todo).where(Todo.user_id == user.id, Todo.id == todo_id)
+    changes = todo.model_dump(exclude_unset=True)
+
+    # Drag and drop: with `Prefer: respond-async` a state flip is queued and
+    # written with others later (202). The todo isn't looked up, flips of
+    # todos deleted by then are dropped.
+    if deferrable(changes, prefer, if_match) and (
+        await todo_write_behind.submit(user.id, todo_id, todo.state)
+    ):
+        return ORJSONResponse(
+            {'message': 'Todo update accepted.'},
+            status_code=HTTPStatus.ACCEPTED,
+            headers={'Preference-Applied': 'respond-async'},
+        )
+
+    await todo_write_behind.discard(user.id, [todo_id])
+    conditions = todo_conditions(user.id, todo_id, if_match)
+
+    if changes:
+        query = update(Todo).where(*conditions).values(**changes)
+        query = query.returning(Todo)
+    else:
+        query = select(Todo).where(*conditions)
+
+    db_todo = await session.scalar(
+        query.execution_options(populate_existing=True)
     )
 
     if not db_todo:
-        logger.error(f'Todo not found - {todo_id}')
-
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND, detail='Todo not found.'
+        raise await todo_precondition_failed(
+            session, user.id, todo_id, if_match
         )
 
-    for key, value in todo.model_dump(exclude_unset=True).items():
-        setattr(db_todo, key, value)
+    if changes:
+        queue_todo_event(session, 'updated', user.id, [todo_id])
 
-    session.add(db_todo)
-    session.commit()
-    session.refresh(db_todo)
+    await session.commit()
+    response.headers['ETag'] = updated_at_etag(db_todo.updated_at)
 
     return db_todo
 
 
 @router.delete('/{todo_id}', response_model=Message)
-def delete_todo(todo_id: int, session: T_Session, user: T_CurrentUser):
+async def delete_todo(
+    todo_id: int,
+    session: T_Session,
+    user: T_CurrentUser,
+    if_match: Annotated[str | None, Header()] = None,
+):
     logger.debug(f'Starting todo deletion - {todo_id}')
 
-    todo = session.scalar(
-        select(Todo).where(Todo.user_id == user.id, Todo.id == todo_id)
+    deleted = await session.scalar(
+        trash_todos(*todo_conditions(user.id, todo_id, if_match))
     )
 
-    if not todo:
-        logger.error(f'Todo not found - {todo_id}')
-
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND, detail='Todo not found.'
+    if not deleted:
+        raise await todo_precondition_failed(
+            session, user.id, todo_id, if_match
         )
 
-    session.delete(todo)
-    session.commit()
+    queue_todo_event(session, 'updated', user.id, [todo_id])
+    await session.commit()
 
     return {'message': 'Task has been deleted successfully.'}
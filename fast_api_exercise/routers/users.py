@@ -2,15 +2,19 @@ from http import HTTPStatus
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fast_api_exercise.database import get_session
+from fast_api_exercise.database import get_read_session, get_session
+from fast_api_exercise.etags import ConditionalGet, weak_etag
 from fast_api_exercise.models.user import User
+from fast_api_exercise.pagination import next_cursor, paginate
 from fast_api_exercise.schemas import (
-    FilterPage,
+    FilterUser,
     Message,
+    UserFields,
     UserList,
     UserPublic,
     UserSchema,
@@ -18,20 +22,28 @@ from fast_api_exercise.schemas import (
 from fast_api_exercise.security import (
     get_current_user,
     get_password_hash,
+    principals,
+)
+from fast_api_exercise.serialization import (
+    dump_rows,
+    select_columns,
+    with_id,
 )
 from fast_api_exercise.settings import logger
 
 router = APIRouter(prefix='/users', tags=['users'])
 
-T_Session = Annotated[Session, Depends(get_session)]
+T_Session = Annotated[AsyncSession, Depends(get_session)]
+T_ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
 T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Conditional = Annotated[ConditionalGet, Depends()]
 
 
 @router.post('/', status_code=HTTPStatus.CREATED, response_model=UserPublic)
-def create_user(user: UserSchema, session: T_Session):
+async def create_user(user: UserSchema, session: T_Session):
     logger.debug(f'Starting user creation - {user.email} - {user.username}')
 
-    db_user = session.scalar(
+    db_user = await session.scalar(
         select(User).where(
             (User.username == user.username) | (User.email == user.email)
         )
@@ -56,35 +68,57 @@ def create_user(user: UserSchema, session: T_Session):
     # db_user = User(**user.model_dump())
     db_user = User(
         username=user.username,
-        password=get_password_hash(user.password),
+        password=await get_password_hash(user.password),
         email=user.email,
     )
 
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
     logger.info(f'User created - {db_user.id}')
 
     return db_user
 
 
 @router.get('/', response_model=UserList)
-def read_users(
-    session: T_Session, filter_users: Annotated[FilterPage, Query()]
+async def read_users(
+    session: T_ReadSession,
+    filter_users: Annotated[FilterUser, Query()],
 ):
-    logger.debug('Starting listing of users')
-    users = session.scalars(
-        select(User).offset(filter_users.offset).limit(filter_users.limit)
-    ).all()
+    logger.debug(f'Starting listing of users - {filter_users}')
+
+    fields = filter_users.field_names
+    users = await session.execute(
+        paginate(
+            select(*select_columns(User, with_id(fields))),
+            User.id,
+            filter_users,
+        )
+    )
+    users = users.all()
 
-    return {'users': users}
+    return ORJSONResponse({
+        'users': dump_rows(users, fields),
+        'next_cursor': next_cursor(users, filter_users),
+    })
 
 
 @router.get('/{user_id}', response_model=UserPublic)
-def read_user(user_id: int, session: T_Session):
-    logger.debug(f'Starting user search - {user_id}')
+async def read_user(
+    user_id: int,
+    session: T_ReadSession,
+    user_fields: Annotated[UserFields, Query()],
+    conditional: T_Conditional,
+):
+    logger.debug(f'Starting user search - {user_id} - {user_fields}')
 
-    db_user = session.scalar(select(User).where(User.id == user_id))
+    fields = user_fields.field_names
+    db_user = (
+        await session.execute(
+            select(*select_columns(User, fields), User.updated_at).where(
+                User.id == user_id
+            )
+        )
+    ).first()
 
     if not db_user:
         logger.error(f'User not found - {user_id}')
@@ -93,11 +127,16 @@ def read_user(user_id: int, session: T_Session):
             status_code=HTTPStatus.NOT_FOUND, detail='User not found'
         )
 
-    return db_user
+    etag = weak_etag(db_user.updated_at)
+    conditional.check(etag)
+
+    return ORJSONResponse(
+        dump_rows([db_user], fields)[0], headers={'ETag': etag}
+    )
 
 
 @router.put('/{user_id}', response_model=UserPublic)
-def update_user(
+async def update_user(
     user_id: int,
     user: UserSchema,
     session: T_Session,
@@ -112,14 +151,14 @@ def update_user(
             status_code=HTTPStatus.FORBIDDEN, detail='Not enough permissions'
         )
 
+    old_email = current_user.email
+
     try:
         current_user.username = user.username
-        current_user.password = get_password_hash(user.password)
+        current_user.password = await get_password_hash(user.password)
         current_user.email = user.email
-        session.commit()
-        session.refresh(current_user)
-
-        return current_user
+        current_user.token_version += 1
+        await session.commit()
 
     except IntegrityError:
         logger.error(f'Username or Email already exists - {user}')
@@ -129,9 +168,15 @@ def update_user(
             detail='Username or Email already exists',
         )
 
+    # Tokens issued before the update carry the previous version
+    principals.pop(old_email)
+    principals.pop(current_user.email)
+
+    return current_user
+
 
 @router.delete('/{user_id}', response_model=Message)
-def delete_user(
+async def delete_user(
     user_id: int,
     session: T_Session,
     current_user: T_CurrentUser,
@@ -145,7 +190,9 @@ def delete_user(
             status_code=HTTPStatus.FORBIDDEN, detail='Not enough permissions'
         )
 
-    session.delete(current_user)
-    session.commit()
+    # the todos go with the ON DELETE CASCADE, never loaded
+    await session.delete(current_user)
+    await session.commit()
+    principals.pop(current_user.email)
 
     return {'message': 'User deleted'}
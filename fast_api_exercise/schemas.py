@@ -1,8 +1,20 @@
 from datetime import datetime
-
-from pydantic import BaseModel, ConfigDict, EmailStr
-
+from typing import Annotated, ClassVar, Literal
+
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    ConfigDict,
+    EmailStr,
+    Field,
+    field_validator,
+    model_validator,
+)
+
+from fast_api_exercise.changes import CHANGES_MAX_LIMIT
 from fast_api_exercise.models.user import TodoState
+from fast_api_exercise.pagination import decode_cursor, decode_watermark
+from fast_api_exercise.serialization import parse_fields
 
 
 class Message(BaseModel):
@@ -24,6 +36,7 @@ class UserPublic(BaseModel):
 
 class UserList(BaseModel):
     users: list[UserPublic]
+    next_cursor: str | None = None
 
 
 class Token(BaseModel):
@@ -38,11 +51,60 @@ class TokenData(BaseModel):
 class FilterPage(BaseModel):
     offset: int = 0
     limit: int = 100
+    cursor: str | None = None
+
+    @field_validator('cursor')
+    @classmethod
+    def validate_cursor(cls, cursor: str | None) -> str | None:
+        if cursor:
+            decode_cursor(cursor)
+
+        return cursor
+
+
+class SparseFields(BaseModel):
+    """`?fields=id,title` on reads, checked against `public_schema`."""
+
+    public_schema: ClassVar[type[BaseModel]]
+
+    fields: str | None = None
+
+    @field_validator('fields')
+    @classmethod
+    def validate_fields(cls, fields: str | None) -> str | None:
+        parse_fields(fields, tuple(cls.public_schema.model_fields))
+
+        return fields
+
+    @property
+    def field_names(self) -> tuple[str, ...]:
+        return parse_fields(
+            self.fields, tuple(self.public_schema.model_fields)
+        )
+
+
+class UserFields(SparseFields):
+    public_schema = UserPublic
+
+
+class FilterUser(FilterPage, UserFields):
+    pass
+
+
+def check_no_nul(text: str) -> str:
+    # PostgreSQL text can't hold them, the write would fail with a 500
+    if '\x00' in text:
+        raise ValueError('NUL characters are not allowed')
+
+    return text
+
+
+TodoText = Annotated[str, AfterValidator(check_no_nul)]
 
 
 class TodoSchema(BaseModel):
-    title: str
-    description: str
+    title: TodoText
+    description: TodoText
     # state: TodoState
 
 
@@ -55,15 +117,95 @@ class TodoPublic(TodoSchema):
 
 class TodoList(BaseModel):
     todos: list[TodoPublic]
+    next_cursor: str | None = None
+
+
+class FilterChanges(BaseModel):
+    since: str | None = None
+    limit: int = Field(100, ge=1, le=CHANGES_MAX_LIMIT)
+
+    @field_validator('since')
+    @classmethod
+    def validate_since(cls, since: str | None) -> str | None:
+        if since:
+            decode_watermark(since)
+
+        return since
+
+
+class TodoChanges(BaseModel):
+    todos: list[TodoPublic]
+    deleted: list[int]
+    # pass back as `since`; unchanged when nothing happened
+    watermark: str | None = None
+    has_more: bool
 
 
-class FilterTodo(FilterPage):
+class TodoStats(BaseModel):
+    states: dict[TodoState, int]
+    total: int
+
+
+class TodoFields(SparseFields):
+    public_schema = TodoPublic
+
+
+class TodoFilters(BaseModel):
     title: str | None = None
     description: str | None = None
     state: TodoState | None = None
+    search: str | None = None
+
+
+class FilterTodo(FilterPage, TodoFilters, TodoFields):
+    @model_validator(mode='after')
+    def validate_search_paging(self):
+        # search results are ordered by rank, not by id
+        if self.search and self.cursor:
+            raise ValueError('cursor cannot be combined with search')
+
+        return self
+
+
+TodoFormat = Literal['ndjson', 'csv']
+
+
+class TodoExport(TodoFilters):
+    format: TodoFormat = 'ndjson'
+
+
+class TodoImport(BaseModel):
+    format: TodoFormat = 'ndjson'
+
+
+class TodoImportError(BaseModel):
+    row: int
+    errors: list[dict]
+
+
+class TodoImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: list[TodoImportError]
+    seconds: float
+    rows_per_second: float
 
 
 class TodoUpdate(BaseModel):
-    title: str | None = None
-    description: str | None = None
+    title: TodoText | None = None
+    description: TodoText | None = None
     state: TodoState | None = None
+
+
+class TodoBulkUpdate(TodoUpdate):
+    id: int
+
+
+class TodoBulkResult(BaseModel):
+    id: int
+    status: int
+    todo: TodoPublic | None = None
+
+
+class TodoBulkResults(BaseModel):
+    results: list[TodoBulkResult]
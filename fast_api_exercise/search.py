@@ -0,0 +1,37 @@
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from sqlalchemy import Connection, Engine, Select, func
+from sqlalchemy.dialects.postgresql import websearch_to_tsquery
+
+from fast_api_exercise.models.user import (
+    TODO_SEARCH_CONFIG,
+    Todo,
+    todo_search_vector,
+)
+
+
+def search_todos(query: Select, term: str) -> Select:
+    """Restrict to todos matching `term` and order them by relevance.
+
+    `term` uses web search syntax ("quoted phrases", `or`, `-excluded`)
+    and is matched against title and description through the
+    `ix_todos_search` GIN index.
+    """
+    ts_query = websearch_to_tsquery(TODO_SEARCH_CONFIG, term)
+
+    return query.where(todo_search_vector.bool_op('@@')(ts_query)).order_by(
+        func.ts_rank(todo_search_vector, ts_query).desc(), Todo.id
+    )
+
+
+def check_search_dialect(bind: Engine | Connection) -> None:
+    """Refuse `?search=` (422) where there is no PostgreSQL full-text search.
+
+    SQLite, in development, has neither `tsvector` nor the GIN index.
+    """
+    if bind.dialect.name != 'postgresql':
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail='Search is only available on PostgreSQL.',
+        )
@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from http import HTTPStatus
 from zoneinfo import ZoneInfo
@@ -5,19 +6,38 @@ from zoneinfo import ZoneInfo
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jwt import DecodeError, ExpiredSignatureError, decode, encode
-from pwdlib import PasswordHash
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from fast_api_exercise.cache import TTLCache
 from fast_api_exercise.database import get_session
+from fast_api_exercise.hashing import (
+    check_password,
+    hash_password,
+    password_hasher,
+)
 from fast_api_exercise.models.user import User
 from fast_api_exercise.schemas import TokenData
 from fast_api_exercise.settings import Settings, logger
 
 settings = Settings()
-pwd_context = PasswordHash.recommended()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/token')
 
+# token subject -> Principal, so hot users are not loaded from the
+# database on every request
+principals = TTLCache(
+    name='principal_cache',
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+    token_version: int
+
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -35,45 +55,44 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def create_user_access_token(user: User | Principal) -> str:
+    return create_access_token(
+        data={
+            'sub': user.email,
+            'uid': user.id,
+            'ver': user.token_version,
+        }
+    )
 
 
-def verify_password(plain_password: str, hashed_password) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.run(hash_password, password)
 
 
-def get_current_user(
-    session: Session = Depends(get_session),
-    token: str = Depends(oauth2_scheme),
-) -> User:
-    logger.debug('Getting the current user')
+async def verify_password(plain_password: str, hashed_password) -> bool:
+    return await password_hasher.run(
+        check_password, plain_password, hashed_password
+    )
+
+
+def credentials_exception() -> HTTPException:
+    logger.error('Could not validate credentials')
+
+    return HTTPException(
+        status_code=HTTPStatus.UNAUTHORIZED,
+        detail='Could not validate credentials',
+        headers={'WWW-Authenticate': 'Bearer'},
+    )
+
 
+def decode_access_token(token: str) -> dict:
     try:
         payload = decode(
             token, settings.SECRET_KEY, algorithms=settings.ALGORITHM
         )
-        username: str = payload.get('sub')
-
-        if not username:
-            logger.error('Could not validate credentials')
-
-            raise HTTPException(
-                status_code=HTTPStatus.UNAUTHORIZED,
-                detail='Could not validate credentials',
-                headers={'WWW-Authenticate': 'Bearer'},
-            )
-
-        token_data = TokenData(username=username)
 
     except DecodeError:
-        logger.error('Could not validate credentials')
-
-        raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail='Could not validate credentials',
-            headers={'WWW-Authenticate': 'Bearer'},
-        )
+        raise credentials_exception()
 
     except ExpiredSignatureError:
         logger.error('Signature has expired')
@@ -84,17 +103,78 @@ def get_current_user(
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
-    user = session.scalar(
+    if not payload.get('sub'):
+        raise credentials_exception()
+
+    return payload
+
+
+async def get_principal(
+    session: AsyncSession, subject: str
+) -> Principal | None:
+    principal = principals.get(subject)
+
+    if principal is None:
+        row = (
+            await session.execute(
+                select(User.id, User.email, User.token_version).where(
+                    User.email == subject
+                )
+            )
+        ).first()
+
+        if not row:
+            return None
+
+        principal = Principal(*row)
+        principals.set(subject, principal)
+
+    return principal
+
+
+async def get_current_user(
+    session: AsyncSession = Depends(get_session),
+    token: str = Depends(oauth2_scheme),
+) -> User:
+    logger.debug('Getting the current user')
+
+    payload = decode_access_token(token)
+    token_data = TokenData(username=payload['sub'])
+
+    user = await session.scalar(
         select(User).where(User.email == token_data.username)
     )
 
     if not user:
-        logger.error('Could not validate credentials')
+        raise credentials_exception()
 
-        raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail='Could not validate credentials',
-            headers={'WWW-Authenticate': 'Bearer'},
-        )
+    if payload.get('ver', user.token_version) != user.token_version:
+        raise credentials_exception()
 
     return user
+
+
+async def get_current_principal(
+    session: AsyncSession = Depends(get_session),
+    token: str = Depends(oauth2_scheme),
+) -> Principal:
+    """Authenticate against the principal cache instead of the users table.
+
+    Routes that only need the user id (and token version) use this rather
+    than `get_current_user`, which always loads the full `User` row.
+    """
+    logger.debug('Getting the current principal')
+
+    payload = decode_access_token(token)
+    principal = await get_principal(session, payload['sub'])
+
+    if not principal:
+        raise credentials_exception()
+
+    if payload.get('uid', principal.id) != principal.id:
+        raise credentials_exception()
+
+    if payload.get('ver', principal.token_version) != principal.token_version:
+        raise credentials_exception()
+
+    return principal
@@ -0,0 +1,56 @@
+from collections.abc import Iterable, Sequence
+
+from sqlalchemy.orm import InstrumentedAttribute
+
+
+def dump_rows(rows: Iterable, fields: Sequence[str]) -> list[dict]:
+    """Plain dicts with `fields` of each row, for an `ORJSONResponse`.
+
+    Skips the `response_model` round trip (pydantic `from_attributes` and
+    `jsonable_encoder`) on read routes. `rows` may be ORM entities or `Row`
+    tuples whose columns are named after the fields.
+    """
+    return [{field: getattr(row, field) for field in fields} for row in rows]
+
+
+def select_columns(
+    model, fields: Sequence[str]
+) -> list[InstrumentedAttribute]:
+    """The columns of `model` named `fields`.
+
+    Selecting these instead of the entity reads only what the response
+    needs and returns `Row` tuples, which skip the identity map.
+    """
+    return [getattr(model, field) for field in fields]
+
+
+def with_id(fields: Sequence[str]) -> tuple[str, ...]:
+    """`fields` plus `id`, which keyset paging needs for `next_cursor`."""
+    return tuple(fields) if 'id' in fields else (*fields, 'id')
+
+
+def parse_fields(
+    fields: str | None, allowed: Sequence[str]
+) -> tuple[str, ...]:
+    """Field names of a `fields=id,title` parameter, in order.
+
+    Every allowed field when `fields` is empty; `ValueError` on unknown
+    names.
+    """
+    selected = tuple(
+        dict.fromkeys(
+            field.strip()
+            for field in (fields or '').split(',')
+            if field.strip()
+        )
+    )
+
+    if not selected:
+        return tuple(allowed)
+
+    unknown = [field for field in selected if field not in allowed]
+
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+
+    return selected
@@ -16,3 +16,31 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRES_MINUTES: int
+
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_PRE_PING: bool = False
+    DATABASE_POOL_RECYCLE: int = -1
+    DATABASE_POOL_TIMEOUT: float = 30
+    # JSON list, e.g. '["postgresql+psycopg://replica1/app"]'
+    DATABASE_REPLICA_URLS: list[str] = []
+    # read-your-writes: how long a client reads from the primary after a
+    # write; 0 sends every read to the replicas
+    DATABASE_STICKY_PRIMARY_SECONDS: float = 5
+
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30
+
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    TODO_TRASH_RETENTION_SECONDS: float = 30 * 24 * 60 * 60
+    TODO_PURGE_INTERVAL_SECONDS: float = 60 * 60
+    TODO_PURGE_BATCH_SIZE: int = 1000
+
+    # opt-in write-behind of the state-only patches sent with
+    # `Prefer: respond-async`; 0 disables it
+    TODO_WRITE_BEHIND_INTERVAL_MS: float = 0
+    TODO_WRITE_BEHIND_MAX_PENDING: int = 10_000
+    # locked by the first worker to start; the others write through
+    TODO_WRITE_BEHIND_JOURNAL: str = 'todo_write_behind.journal'
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import Update, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from fast_api_exercise.changes import delete_todos
+from fast_api_exercise.metrics import metrics
+from fast_api_exercise.models.user import Todo, TodoState
+from fast_api_exercise.settings import Settings, logger
+
+
+def trash_todos(*conditions) -> Update:
+    """Move the matching todos to the trash, returning their ids.
+
+    Todos already in the trash don't match, so trashing twice is a 404.
+    """
+    return (
+        update(Todo)
+        .where(*conditions, Todo.state != TodoState.trash)
+        .values(state=TodoState.trash)
+        .returning(Todo.id)
+    )
+
+
+async def purge_trash(
+    session: AsyncSession, retention: timedelta, batch_size: int
+) -> int:
+    """Hard-delete todos trashed more than `retention` ago.
+
+    Works in batches of `batch_size`, each committed on its own, so locks
+    stay short. `SKIP LOCKED` lets every worker purge at the same time.
+    Deletes leave tombstones for `/todos/changes`.
+    """
+    purged = 0
+
+    while True:
+        batch = (
+            select(Todo.id)
+            .where(
+                Todo.state == TodoState.trash,
+                Todo.updated_at < func.now() - retention,
+            )
+            .order_by(Todo.updated_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        deleted = await session.scalars(
+            delete_todos(Todo.id.in_(batch.scalar_subquery()))
+        )
+        count = len(deleted.all())
+        await session.commit()
+
+        purged += count
+
+        if count < batch_size:
+            break
+
+    metrics.inc('todos_purged_total', purged)
+
+    return purged
+
+
+async def purge_periodically(engine: AsyncEngine, settings: Settings) -> None:
+    retention = timedelta(seconds=settings.TODO_TRASH_RETENTION_SECONDS)
+
+    while True:
+        await asyncio.sleep(settings.TODO_PURGE_INTERVAL_SECONDS)
+
+        try:
+            async with AsyncSession(engine) as session:
+                purged = await purge_trash(
+                    session, retention, settings.TODO_PURGE_BATCH_SIZE
+                )
+        except SQLAlchemyError as exc:
+            logger.error(f'Trash purge failed - {exc}')
+            continue
+
+        logger.info(f'Purged {purged} todos from the trash')
+
+
+class TrashPurger:
+    """Runs `purge_trash` every `TODO_PURGE_INTERVAL_SECONDS`.
+
+    Todos stay restorable (by patching their state) for
+    `TODO_TRASH_RETENTION_SECONDS`. A non-positive interval disables it.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    def start(self, engine: AsyncEngine, settings: Settings) -> None:
+        if settings.TODO_PURGE_INTERVAL_SECONDS > 0:
+            self._task = asyncio.create_task(
+                purge_periodically(engine, settings)
+            )
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+trash_purger = TrashPurger()
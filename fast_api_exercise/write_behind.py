@@ -0,0 +1,333 @@
+import asyncio
+import fcntl
+import os
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import orjson
+from sqlalchemy import DateTime, Integer, cast, column, update, values
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from fast_api_exercise.events import queue_todo_event
+from fast_api_exercise.metrics import metrics
+from fast_api_exercise.models.user import Todo, TodoState
+from fast_api_exercise.settings import Settings, logger
+
+# (user_id, todo_id)
+TodoKey = tuple[int, int]
+# (state, acknowledged at)
+TodoFlip = tuple[TodoState, datetime]
+
+
+async def flush_todo_states(
+    session: AsyncSession, flips: dict[TodoKey, TodoFlip]
+) -> int:
+    """Write queued state flips in a single UPDATE ... FROM (VALUES ...).
+
+    Todos deleted in the meantime are skipped, and so are flips to the
+    state a todo already has, which would only bump its `updated_at`.
+    So are todos written since a flip was acknowledged, by any process:
+    `updated_at` is all they share (which takes the app and database
+    clocks to agree).
+    """
+    changes = values(
+        column('user_id', Integer),
+        column('id', Integer),
+        column('state', Todo.state.type),
+        column('acked_at', DateTime(timezone=True)),
+        name='changes',
+    ).data([
+        (user_id, todo_id, state, acked_at)
+        for (user_id, todo_id), (state, acked_at) in flips.items()
+    ])
+    state = cast(changes.c.state, Todo.state.type)
+
+    updated = await session.execute(
+        update(Todo)
+        .where(
+            Todo.user_id == changes.c.user_id,
+            Todo.id == changes.c.id,
+            Todo.state != TodoState.trash,
+            Todo.state != state,
+            Todo.updated_at <= changes.c.acked_at,
+        )
+        .values(state=state)
+        .returning(Todo.user_id, Todo.id)
+    )
+    updated_ids = defaultdict(list)
+
+    for user_id, todo_id in updated:
+        updated_ids[user_id].append(todo_id)
+
+    for user_id, ids in updated_ids.items():
+        queue_todo_event(session, 'updated', user_id, ids)
+
+    await session.commit()
+
+    return sum(map(len, updated_ids.values()))
+
+
+def read_journal(path: Path) -> dict[TodoKey, TodoFlip]:
+    """The flips a journal holds, coalesced: the last one per todo wins."""
+    flips = {}
+
+    if not path.exists():
+        return flips
+
+    with path.open('rb') as journal:
+        for line in journal:
+            try:
+                user_id, todo_id, state, acked_at = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # torn by a crash before its fsync, so never acknowledged
+                break
+
+            if state is None:
+                flips.pop((user_id, todo_id), None)
+            else:
+                flips[user_id, todo_id] = (
+                    TodoState(state),
+                    datetime.fromisoformat(acked_at),
+                )
+
+    return flips
+
+
+def journal_line(key: TodoKey, flip: TodoFlip | None) -> bytes:
+    # a discard is journaled with no state
+    return orjson.dumps([*key, *(flip or (None, None))]) + b'\n'
+
+
+class TodoWriteBehind:
+    """Acknowledges todo state flips before they reach the database.
+
+    A flip is appended to a local journal and fsync'ed (concurrent ones
+    share the fsync) before `submit` returns, then coalesced per todo and
+    written with the others every `TODO_WRITE_BEHIND_INTERVAL_MS`, in one
+    transaction. After each flush the journal is rewritten with what is
+    still queued; `start` replays it, so a crash loses no acknowledged
+    flip. One process at a time owns a journal: with several workers on
+    the same path, the others write every flip through. A flush skips
+    the todos any of them wrote after a flip was acknowledged.
+
+    Beyond `max_pending` queued flips, `submit` refuses and the caller
+    writes through. Until `start` is called (or with a non-positive
+    interval) it refuses everything.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._engine: AsyncEngine | None = None
+        self._path: Path | None = None
+        self._journal = None
+        self._journal_lock = None
+        self._queued: dict[TodoKey, TodoFlip] = {}
+        self._flushing: dict[TodoKey, TodoFlip] = {}
+        self.max_pending = 0
+
+        metrics.gauge('todo_write_behind_pending', lambda: len(self._queued))
+
+    async def start(self, engine: AsyncEngine, settings: Settings) -> None:
+        if settings.TODO_WRITE_BEHIND_INTERVAL_MS <= 0:
+            return
+
+        path = Path(settings.TODO_WRITE_BEHIND_JOURNAL)
+        # a sidecar file: rewrites replace the journal itself
+        journal_lock = path.with_name(f'{path.name}.lock').open('ab')
+
+        try:
+            fcntl.flock(journal_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            journal_lock.close()
+            logger.warning(
+                f'Todo write-behind journal {path} is used by another '
+                'process - writing todo state flips through'
+            )
+            return
+
+        self._journal_lock = journal_lock
+        self._engine = engine
+        self._path = path
+        self.max_pending = settings.TODO_WRITE_BEHIND_MAX_PENDING
+        # journal appends and rewrites, one at a time
+        self._lock = asyncio.Lock()
+        self._unsynced = self._new_batch()
+        self._flushed = asyncio.Event()
+        self._stopping = asyncio.Event()
+
+        self._queued = await asyncio.to_thread(read_journal, self._path)
+        await asyncio.to_thread(self._rewrite_journal, dict(self._queued))
+
+        if self._queued:
+            logger.info(f'Replayed {len(self._queued)} todo state flips')
+
+        self._task = asyncio.create_task(
+            self._flush_periodically(
+                settings.TODO_WRITE_BEHIND_INTERVAL_MS / 1000
+            )
+        )
+
+    async def stop(self) -> None:
+        if self._task:
+            self._stopping.set()
+            await self._task
+            self._task = None
+            self._journal.close()
+            self._journal_lock.close()
+
+    async def submit(
+        self, user_id: int, todo_id: int, state: TodoState
+    ) -> bool:
+        """Queue a state flip; False when it must be written through."""
+        if self._task is None or self._stopping.is_set():
+            return False
+
+        if len(self._queued) >= self.max_pending:
+            metrics.inc('todo_write_behind_rejected_total')
+            return False
+
+        acked_at = datetime.now(tz=ZoneInfo('UTC'))
+
+        try:
+            await self._record([((user_id, todo_id), (state, acked_at))])
+        except OSError as exc:
+            logger.error(f'Todo write-behind journal failed - {exc}')
+            return False
+
+        metrics.inc('todo_write_behind_accepted_total')
+
+        return True
+
+    async def discard(self, user_id: int, todo_ids: Iterable[int]) -> None:
+        """Drop the queued flips of todos about to be written through.
+
+        The write that follows is newer, so it must not be overwritten by
+        a flush: this waits for one already writing those todos, until
+        they're out of the journal too. Processes without the journal
+        return at once; the flush of its owner skips their writes.
+        """
+        if self._task is None:
+            return
+
+        keys = [(user_id, todo_id) for todo_id in todo_ids]
+
+        if any(key in self._flushing for key in keys):
+            await self._flushed.wait()
+
+        unsynced = {key for key, _ in self._unsynced[0]}
+        keys = [key for key in keys if key in self._queued or key in unsynced]
+
+        if keys:
+            for key in keys:
+                self._queued.pop(key, None)
+
+            # or the journal would bring them back after a crash
+            await self._record([(key, None) for key in keys])
+
+    async def flush(self) -> int:
+        flushing = self._flushing = self._queued
+        self._queued = {}
+
+        if not flushing:
+            return 0
+
+        try:
+            try:
+                with metrics.timer('todo_write_behind_flush_seconds'):
+                    async with AsyncSession(self._engine) as session:
+                        flushed = await flush_todo_states(session, flushing)
+            except SQLAlchemyError:
+                # still in the journal; the next flush retries them
+                for key, flip in flushing.items():
+                    self._queued.setdefault(key, flip)
+
+                raise
+
+            metrics.inc('todo_write_behind_flushed_total', flushed)
+
+            # Until the journal drops them, `discard` waits on these todos:
+            # a crash would replay them over the write it makes way for
+            async with self._lock:
+                await asyncio.to_thread(
+                    self._rewrite_journal, dict(self._queued)
+                )
+        finally:
+            self._flushing = {}
+            self._flushed.set()
+            self._flushed = asyncio.Event()
+
+        return flushed
+
+    async def _flush_periodically(self, interval: float) -> None:
+        # the last flush runs once `stop` is called
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), interval)
+            except TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+            except (SQLAlchemyError, OSError) as exc:
+                logger.error(f'Todo write-behind flush failed - {exc}')
+
+            if self._stopping.is_set():
+                break
+
+    @staticmethod
+    def _new_batch() -> tuple[list, asyncio.Future]:
+        return [], asyncio.get_running_loop().create_future()
+
+    async def _record(self, entries: list) -> None:
+        # whoever takes the lock first appends every entry waiting so far
+        batch, synced = self._unsynced
+        batch.extend(entries)
+
+        async with self._lock:
+            if batch is self._unsynced[0]:
+                self._unsynced = self._new_batch()
+
+                try:
+                    await asyncio.to_thread(self._append, batch)
+                except OSError as exc:
+                    synced.set_exception(exc)
+                else:
+                    for key, flip in batch:
+                        if flip is None:
+                            self._queued.pop(key, None)
+                        else:
+                            self._queued[key] = flip
+
+                    synced.set_result(None)
+
+        await synced
+
+    def _append(self, entries: list) -> None:
+        self._journal.writelines(
+            journal_line(key, flip) for key, flip in entries
+        )
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _rewrite_journal(self, flips: dict[TodoKey, TodoFlip]) -> None:
+        tmp = self._path.with_suffix('.tmp')
+
+        with tmp.open('wb') as journal:
+            journal.writelines(
+                journal_line(key, flip) for key, flip in flips.items()
+            )
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        if self._journal:
+            self._journal.close()
+
+        tmp.replace(self._path)
+        self._journal = self._path.open('ab')
+
+
+todo_write_behind = TodoWriteBehind()
@@ -0,0 +1,99 @@
+"""add todo counters
+
+Revision ID: 06a13647b0ae
+Revises: b935ef127024
+Create Date: 2026-10-18 16:40:27.716709
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '06a13647b0ae'
+down_revision: Union[str, None] = 'b935ef127024'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Must match fast_api_exercise.models.user.TODO_COUNTERS_FUNCTION
+TODO_COUNTERS_FUNCTION = """
+CREATE OR REPLACE FUNCTION todo_counters_refresh() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO todo_counters (user_id, state, count)
+        SELECT user_id, state, count(*) FROM new_todos
+        GROUP BY user_id, state
+        ORDER BY user_id, state
+        ON CONFLICT (user_id, state)
+        DO UPDATE SET count = todo_counters.count + excluded.count;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO todo_counters (user_id, state, count)
+        SELECT user_id, state, sum(delta) FROM (
+            SELECT user_id, state, 1 AS delta FROM new_todos
+            UNION ALL
+            SELECT user_id, state, -1 FROM old_todos
+        ) AS changes
+        GROUP BY user_id, state
+        HAVING sum(delta) <> 0
+        ORDER BY user_id, state
+        ON CONFLICT (user_id, state)
+        DO UPDATE SET count = todo_counters.count + excluded.count;
+    ELSE
+        UPDATE todo_counters SET count = todo_counters.count - deleted.count
+        FROM (
+            SELECT user_id, state, count(*) AS count FROM old_todos
+            GROUP BY user_id, state
+        ) AS deleted
+        WHERE todo_counters.user_id = deleted.user_id
+            AND todo_counters.state = deleted.state;
+    END IF;
+
+    RETURN NULL;
+END
+$$
+"""
+TODO_COUNTERS_TRIGGERS = {
+    'insert': 'NEW TABLE AS new_todos',
+    'update': 'OLD TABLE AS old_todos NEW TABLE AS new_todos',
+    'delete': 'OLD TABLE AS old_todos',
+}
+
+
+def upgrade() -> None:
+    op.create_table('todo_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('state', postgresql.ENUM(name='todostate', create_type=False), nullable=False),
+    sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'state')
+    )
+
+    # block writes to todos so the backfill and the triggers agree
+    op.execute('LOCK TABLE todos IN SHARE ROW EXCLUSIVE MODE')
+    op.execute(TODO_COUNTERS_FUNCTION)
+
+    for operation, transition_tables in TODO_COUNTERS_TRIGGERS.items():
+        op.execute(
+            f'CREATE TRIGGER todo_counters_{operation} '
+            f'AFTER {operation.upper()} ON todos '
+            f'REFERENCING {transition_tables} '
+            'FOR EACH STATEMENT EXECUTE FUNCTION todo_counters_refresh()'
+        )
+
+    op.execute(
+        'INSERT INTO todo_counters (user_id, state, count) '
+        'SELECT user_id, state, count(*) FROM todos GROUP BY user_id, state'
+    )
+
+
+def downgrade() -> None:
+    for operation in TODO_COUNTERS_TRIGGERS:
+        op.execute(f'DROP TRIGGER todo_counters_{operation} ON todos')
+
+    op.execute('DROP FUNCTION todo_counters_refresh()')
+    op.drop_table('todo_counters')
@@ -0,0 +1,103 @@
+"""partition todos by user_id
+
+Revision ID: 5d2e8c41a7f3
+Revises: e7bfa77652b5
+Create Date: 2026-10-18 17:02:48.193771
+
+Rebuilds todos as a table hash-partitioned on user_id (or back) and
+copies every row over, holding an ACCESS EXCLUSIVE lock on todos until
+the migration commits: run it in a maintenance window. Indexes and the
+counter triggers are created after the copy, so the load neither
+maintains them row by row nor counts the todos twice.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2e8c41a7f3'
+down_revision: Union[str, None] = 'e7bfa77652b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Must match fast_api_exercise.models.user.TODO_PARTITIONS
+TODO_PARTITIONS = 16
+TODO_COLUMNS = 'id, title, description, user_id, state, created_at, updated_at'
+TODO_COUNTERS_TRIGGERS = {
+    'insert': 'NEW TABLE AS new_todos',
+    'update': 'OLD TABLE AS old_todos NEW TABLE AS new_todos',
+    'delete': 'OLD TABLE AS old_todos',
+}
+
+
+def rebuild_todos(primary_key: Sequence[str], **table_kw) -> None:
+    op.execute('LOCK TABLE todos IN ACCESS EXCLUSIVE MODE')
+    op.rename_table('todos', 'todos_old')
+    # the primary key index name has to be free for the new table
+    op.execute('ALTER INDEX todos_pkey RENAME TO todos_old_pkey')
+
+    op.create_table('todos',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('todos_id_seq'::regclass)"), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('state', postgresql.ENUM(name='todostate', create_type=False), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='todos_user_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint(*primary_key, name='todos_pkey'),
+    **table_kw,
+    )
+
+    if 'postgresql_partition_by' in table_kw:
+        for remainder in range(TODO_PARTITIONS):
+            op.execute(
+                f'CREATE TABLE todos_p{remainder} PARTITION OF todos '
+                f'FOR VALUES WITH (MODULUS {TODO_PARTITIONS}, '
+                f'REMAINDER {remainder})'
+            )
+
+    op.execute(
+        f'INSERT INTO todos ({TODO_COLUMNS}) '
+        f'SELECT {TODO_COLUMNS} FROM todos_old'
+    )
+    # dropping todos_old would drop the sequence it owns
+    op.execute('ALTER SEQUENCE todos_id_seq OWNED BY todos.id')
+    op.drop_table('todos_old')
+
+    op.create_index('ix_todos_user_id_id', 'todos', ['user_id', 'id'], unique=False)
+    op.create_index('ix_todos_user_id_state_id', 'todos', ['user_id', 'state', 'id'], unique=False)
+    op.create_index('ix_todos_user_id_updated_at_id', 'todos', ['user_id', 'updated_at', 'id'], unique=False)
+    op.create_index('ix_todos_trash_updated_at', 'todos', ['updated_at'], unique=False, postgresql_where=sa.text("state = 'trash'"))
+    # Must match fast_api_exercise.models.user.todo_search_vector
+    op.create_index(
+        'ix_todos_search',
+        'todos',
+        [sa.text("to_tsvector('simple'::regconfig, (title || ' ') || description)")],
+        unique=False,
+        postgresql_using='gin',
+    )
+
+    for operation, transition_tables in TODO_COUNTERS_TRIGGERS.items():
+        op.execute(
+            f'CREATE TRIGGER todo_counters_{operation} '
+            f'AFTER {operation.upper()} ON todos '
+            f'REFERENCING {transition_tables} '
+            'FOR EACH STATEMENT EXECUTE FUNCTION todo_counters_refresh()'
+        )
+
+
+def upgrade() -> None:
+    # a partitioned table's primary key must include the partition key
+    rebuild_todos(
+        ['id', 'user_id'], postgresql_partition_by='HASH (user_id)'
+    )
+
+
+def downgrade() -> None:
+    rebuild_todos(['id'])
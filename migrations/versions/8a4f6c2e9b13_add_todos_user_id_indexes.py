@@ -0,0 +1,33 @@
+"""add todos user_id indexes
+
+Revision ID: 8a4f6c2e9b13
+Revises: 3c1d8e5f2a47
+Create Date: 2026-10-18 15:45:37.902164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4f6c2e9b13'
+down_revision: Union[str, None] = '3c1d8e5f2a47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps writes to todos going while the index builds,
+    # which can't happen in a transaction. If it fails, drop the INVALID
+    # index it leaves behind before running it again
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_user_id_id', 'todos', ['user_id', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_todos_user_id_state_id', 'todos', ['user_id', 'state', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_todos_user_id_state_id', table_name='todos', postgresql_concurrently=True)
+        op.drop_index('ix_todos_user_id_id', table_name='todos', postgresql_concurrently=True)
@@ -0,0 +1,82 @@
+"""notify todo events from triggers
+
+Revision ID: af3ec1f3d896
+Revises: 5d2e8c41a7f3
+Create Date: 2026-10-18 17:48:21.305417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'af3ec1f3d896'
+down_revision: Union[str, None] = '5d2e8c41a7f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Must match fast_api_exercise.models.user.TODO_EVENTS_FUNCTION
+TODO_EVENTS_FUNCTION = """
+CREATE OR REPLACE FUNCTION todo_events_notify() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    user_ids integer[];
+    ids integer[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(user_id), array_agg(id) INTO user_ids, ids
+        FROM old_todos
+        WHERE EXISTS (SELECT FROM users WHERE users.id = old_todos.user_id);
+    ELSE
+        SELECT array_agg(user_id), array_agg(id) INTO user_ids, ids
+        FROM new_todos;
+    END IF;
+
+    PERFORM pg_notify('todo_events', json_build_object(
+        'type', CASE TG_OP
+            WHEN 'INSERT' THEN 'created'
+            WHEN 'UPDATE' THEN 'updated'
+            ELSE 'deleted'
+        END,
+        'user_id', user_id,
+        'ids', json_agg(id ORDER BY id)
+    )::text)
+    FROM (
+        SELECT user_id, id, (
+            row_number() OVER (PARTITION BY user_id ORDER BY id) - 1
+        ) / 500 AS chunk
+        FROM unnest(user_ids, ids) AS changes (user_id, id)
+    ) AS changes
+    GROUP BY user_id, chunk
+    ORDER BY user_id, chunk;
+
+    RETURN NULL;
+END
+$$
+"""
+TODO_EVENTS_TRIGGERS = {
+    'insert': 'NEW TABLE AS new_todos',
+    'update': 'OLD TABLE AS old_todos NEW TABLE AS new_todos',
+    'delete': 'OLD TABLE AS old_todos',
+}
+
+
+def upgrade() -> None:
+    op.execute(TODO_EVENTS_FUNCTION)
+
+    for operation, transition_tables in TODO_EVENTS_TRIGGERS.items():
+        op.execute(
+            f'CREATE TRIGGER todo_events_{operation} '
+            f'AFTER {operation.upper()} ON todos '
+            f'REFERENCING {transition_tables} '
+            'FOR EACH STATEMENT EXECUTE FUNCTION todo_events_notify()'
+        )
+
+
+def downgrade() -> None:
+    for operation in TODO_EVENTS_TRIGGERS:
+        op.execute(f'DROP TRIGGER todo_events_{operation} ON todos')
+
+    op.execute('DROP FUNCTION todo_events_notify()')
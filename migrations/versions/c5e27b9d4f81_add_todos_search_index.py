@@ -0,0 +1,39 @@
+"""add todos full-text search index
+
+Revision ID: c5e27b9d4f81
+Revises: 8a4f6c2e9b13
+Create Date: 2026-10-18 16:02:11.583019
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e27b9d4f81'
+down_revision: Union[str, None] = '8a4f6c2e9b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps writes to todos going while the index builds,
+    # which can't happen in a transaction. If it fails, drop the INVALID
+    # index it leaves behind before running it again
+    with op.get_context().autocommit_block():
+        # Must match fast_api_exercise.models.user.todo_search_vector
+        op.create_index(
+            'ix_todos_search',
+            'todos',
+            [sa.text("to_tsvector('simple'::regconfig, (title || ' ') || description)")],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_todos_search', table_name='todos', postgresql_using='gin', postgresql_concurrently=True)
@@ -0,0 +1,33 @@
+"""cascade todo deletes from users
+
+Revision ID: e7bfa77652b5
+Revises: faf619d2bea5
+Create Date: 2026-10-18 16:45:07.498262
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7bfa77652b5'
+down_revision: Union[str, None] = 'faf619d2bea5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint('todos_user_id_fkey', 'todos', type_='foreignkey')
+    op.create_foreign_key(
+        'todos_user_id_fkey', 'todos', 'users', ['user_id'], ['id'],
+        ondelete='CASCADE',
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('todos_user_id_fkey', 'todos', type_='foreignkey')
+    op.create_foreign_key(
+        'todos_user_id_fkey', 'todos', 'users', ['user_id'], ['id']
+    )
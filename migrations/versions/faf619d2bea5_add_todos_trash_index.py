@@ -0,0 +1,31 @@
+"""add todos trash index
+
+Revision ID: faf619d2bea5
+Revises: 06a13647b0ae
+Create Date: 2026-10-18 16:44:36.355411
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'faf619d2bea5'
+down_revision: Union[str, None] = '06a13647b0ae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps writes to todos going while the index builds,
+    # which can't happen in a transaction. If it fails, drop the INVALID
+    # index it leaves behind before running it again
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_trash_updated_at', 'todos', ['updated_at'], unique=False, postgresql_where=sa.text("state = 'trash'"), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_todos_trash_updated_at', table_name='todos', postgresql_where=sa.text("state = 'trash'"), postgresql_concurrently=True)
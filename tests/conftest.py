@@ -3,15 +3,21 @@ from datetime import datetime
 
 import factory
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, event
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
 from testcontainers.postgres import PostgresContainer
 
 from fast_api_exercise.app import app
-from fast_api_exercise.database import get_session
+from fast_api_exercise.database import get_read_session, get_session
 from fast_api_exercise.models.user import User, table_registry
-from fast_api_exercise.security import create_access_token, get_password_hash
+from fast_api_exercise.security import (
+    create_user_access_token,
+    get_password_hash,
+    principals,
+)
 
 
 class UserFactory(factory.Factory):
@@ -30,39 +36,46 @@ def token(client, user):
     #     data={'username': user.email, 'password': user.clean_password},
     # )
     # return response.json()['access_token']
-    token = create_access_token({'sub': user.email})
+    token = create_user_access_token(user)
 
     return token
 
 
-@pytest.fixture
-def user(session):
+@pytest_asyncio.fixture
+async def user(session):
     password = 'testtest'
-    user = UserFactory(password=get_password_hash(password))
+    user = UserFactory(password=await get_password_hash(password))
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     user.clean_password = password
 
     return user
 
 
-@pytest.fixture
-def other_user(session):
+@pytest_asyncio.fixture
+async def other_user(session):
     password = 'testtest'
-    user = UserFactory(password=get_password_hash(password))
+    user = UserFactory(password=await get_password_hash(password))
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     user.clean_password = password
 
     return user
 
 
+@pytest.fixture(autouse=True)
+def clear_principals():
+    # every test recreates the tables, so cached principals must not leak
+    yield
+    principals.clear()
+
+
 @pytest.fixture
 def client(session):
     def get_client_override():
@@ -70,25 +83,28 @@ def client(session):
 
     with TestClient(app) as client:
         app.dependency_overrides[get_session] = get_client_override
+        app.dependency_overrides[get_read_session] = get_client_override
         yield client
 
     app.dependency_overrides.clear()
 
 
-@pytest.fixture
-def session(engine):
+@pytest_asyncio.fixture
+async def session(engine):
     # sqlite in memorie
-    # engine = create_engine(
-    #     'sqlite://',
+    # engine = create_async_engine(
+    #     'sqlite+aiosqlite:///:memory:',
     #     connect_args={'check_same_thread': False},
     #     poolclass=StaticPool,
     # )
-    table_registry.metadata.create_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
 
-    with Session(engine) as session:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
 
-    table_registry.metadata.drop_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.drop_all)
 
 
 @contextmanager
@@ -110,10 +126,24 @@ def mock_db_time():
     return _mock_db_time
 
 
+@pytest.fixture
+def statements(engine):
+    # every statement sent, setup included: tests clear it before acting
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', capture)
+    yield statements
+    event.remove(engine.sync_engine, 'before_cursor_execute', capture)
+
+
 @pytest.fixture(scope='session')
 def engine():
     with PostgresContainer('postgres:16', driver='psycopg') as postgres:
-        _engine = create_engine(postgres.get_connection_url())
+        _engine = create_async_engine(
+            postgres.get_connection_url(), poolclass=NullPool
+        )
 
-        with _engine.begin():
-            yield _engine
+        yield _engine
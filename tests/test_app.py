@@ -66,7 +66,7 @@ def test_read_users(client):
 
     # assert
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'users': []}
+    assert response.json() == {'users': [], 'next_cursor': None}
 
 
 def test_read_user(client, user):
@@ -99,7 +99,10 @@ def test_read_users_with_users(client, user):
 
     # assert
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'users': [user_schema]}
+    assert response.json() == {
+        'users': [user_schema],
+        'next_cursor': None,
+    }
 
 
 def test_update_user(client, user, token):
@@ -1,7 +1,9 @@
 from http import HTTPStatus
 
+import pytest
 from freezegun import freeze_time
 
+from fast_api_exercise.models.user import Todo
 from fast_api_exercise.security import create_access_token
 
 
@@ -20,6 +22,25 @@ def test_get_jwt_token(client, user):
     assert 'token_type' in token
 
 
+@pytest.mark.asyncio
+async def test_get_jwt_token_does_not_load_todos(
+    session, client, user, statements
+):
+    session.add_all([
+        Todo(title=str(i), description='', user_id=user.id) for i in range(5)
+    ])
+    await session.commit()
+    statements.clear()
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert not [statement for statement in statements if 'todos' in statement]
+
+
 def test_jwt_invalid_token(client):
     # act
     response = client.delete(
@@ -137,3 +158,22 @@ def test_token_expired_dont_refresh(client, user):
         )
         assert response.status_code == HTTPStatus.UNAUTHORIZED
         assert response.json() == {'detail': 'Signature has expired'}
+
+
+def test_token_revoked_after_user_update(client, user, token):
+    client.put(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={
+            'username': user.username,
+            'email': user.email,
+            'password': 'mynewpassword',
+        },
+    )
+
+    response = client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Could not validate credentials'}
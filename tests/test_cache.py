@@ -0,0 +1,35 @@
+from fast_api_exercise.cache import TTLCache
+from fast_api_exercise.metrics import metrics
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    cache = TTLCache(name='test_hits', maxsize=2, ttl=60)
+    cache.set('a', 1)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert metrics.value('test_hits_hits_total') == 1
+    assert metrics.value('test_hits_misses_total') == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(name='test_lru', maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3  # noqa: PLR2004
+    assert metrics.value('test_lru_evictions_total') == 1
+    assert metrics.value('test_lru_size') == 2  # noqa: PLR2004
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(name='test_ttl', maxsize=2, ttl=0)
+    cache.set('a', 1)
+
+    assert cache.get('a') is None
+    assert len(cache) == 0
@@ -0,0 +1,180 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+
+from fast_api_exercise.events import TodoEventHub, todo_event_stream
+from fast_api_exercise.metrics import metrics
+from fast_api_exercise.models.user import Todo, TodoState
+from fast_api_exercise.trash import purge_trash
+
+
+async def next_events(queue: asyncio.Queue, count: int) -> list[dict]:
+    return [await asyncio.wait_for(queue.get(), 5) for _ in range(count)]
+
+
+def test_hub_publishes_only_to_the_user_subscribers():
+    hub = TodoEventHub()
+
+    with hub.subscribe(1) as queue, hub.subscribe(2) as other_queue:
+        hub.publish({'type': 'created', 'user_id': 1, 'ids': [1]})
+
+        assert queue.get_nowait() == {
+            'type': 'created',
+            'user_id': 1,
+            'ids': [1],
+        }
+        assert other_queue.empty()
+
+    assert metrics.value('todo_events_subscribers') == 0
+
+
+def test_hub_drops_events_for_stalled_subscribers():
+    hub = TodoEventHub()
+    dropped = metrics.value('todo_events_dropped_total')
+
+    with (
+        patch('fast_api_exercise.events.TODO_EVENTS_QUEUE_SIZE', 1),
+        hub.subscribe(1) as queue,
+    ):
+        hub.publish({'type': 'created', 'user_id': 1, 'ids': [1]})
+        hub.publish({'type': 'created', 'user_id': 1, 'ids': [2]})
+
+    assert queue.qsize() == 1
+    assert metrics.value('todo_events_dropped_total') == dropped + 1
+
+
+@pytest.mark.asyncio
+async def test_event_stream_sends_events_and_keepalives():
+    hub = TodoEventHub()
+    stream = todo_event_stream(1, hub, keepalive=0.01)
+
+    assert await stream.__anext__() == b': connected\n\n'
+    assert await stream.__anext__() == b': keepalive\n\n'
+
+    hub.publish({'type': 'deleted', 'user_id': 1, 'ids': [1, 2]})
+
+    assert (
+        await stream.__anext__() == b'event: deleted\ndata: {"ids":[1,2]}\n\n'
+    )
+
+    await stream.aclose()
+
+    assert not hub._subscribers
+
+
+@pytest.mark.asyncio
+async def test_todo_writes_notify_listeners(
+    engine, client, user, token, statements
+):
+    hub = TodoEventHub()
+    await hub.start(engine)
+    headers = {'Authorization': f'Bearer {token}'}
+
+    try:
+        await asyncio.wait_for(hub.listening.wait(), 5)
+
+        with hub.subscribe(user.id) as queue:
+            client.post(
+                '/todos/',
+                headers=headers,
+                json={'title': 't', 'description': ''},
+            )
+            statements.clear()
+            client.patch('/todos/1', headers=headers, json={'state': 'done'})
+            patch_statements = len(statements)
+            client.delete('/todos/1', headers=headers)
+
+            todo_events = await next_events(queue, 3)
+    finally:
+        await hub.stop()
+
+    assert [(event['type'], event['ids']) for event in todo_events] == [
+        ('created', [1]),
+        ('updated', [1]),
+        # deleting moves the todo to the trash
+        ('updated', [1]),
+    ]
+    # the triggers on todos notify, without a statement of their own
+    assert patch_statements == 1
+
+
+@pytest.mark.asyncio
+async def test_todo_events_are_sent_on_commit_only(engine, session, user):
+    hub = TodoEventHub()
+    await hub.start(engine)
+
+    try:
+        await asyncio.wait_for(hub.listening.wait(), 5)
+
+        user_id = user.id
+
+        with hub.subscribe(user_id) as queue:
+            session.add(Todo(title='', description='', user_id=user_id))
+            await session.flush()
+            await session.rollback()
+            session.add_all([
+                Todo(title=str(i), description='', user_id=user_id)
+                for i in range(501)
+            ])
+            await session.commit()
+
+            todo_events = await next_events(queue, 2)
+    finally:
+        await hub.stop()
+
+    # ids are split across NOTIFY payloads
+    assert [(event['type'], len(event['ids'])) for event in todo_events] == [
+        ('created', 500),
+        ('created', 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_trash_purge_notifies_deletes(engine, session, user, other_user):
+    user_id, other_user_id = user.id, other_user.id
+    session.add_all([
+        Todo(title='', description='', user_id=owner, state=TodoState.trash)
+        for owner in (user_id, user_id, other_user_id)
+    ])
+    await session.commit()
+    # listening from here on, without the inserts
+    hub = TodoEventHub()
+    await hub.start(engine)
+
+    try:
+        await asyncio.wait_for(hub.listening.wait(), 5)
+
+        with (
+            hub.subscribe(user_id) as queue,
+            hub.subscribe(other_user_id) as other_queue,
+        ):
+            await session.delete(other_user)
+            await session.commit()
+            await purge_trash(session, timedelta(0), batch_size=10)
+
+            todo_events = await next_events(queue, 1)
+    finally:
+        await hub.stop()
+
+    assert [(event['type'], event['ids']) for event in todo_events] == [
+        ('deleted', [1, 2]),
+    ]
+    # sent before the purge, if at all: a deleted user hears nothing
+    assert other_queue.empty()
+
+
+def test_todo_events_route_streams_the_user_events(client, user, token):
+    async def finite_stream(user_id):
+        yield f': user {user_id}\n\n'.encode()
+
+    with patch(
+        'fast_api_exercise.routers.todos.todo_event_stream', finite_stream
+    ):
+        response = client.get(
+            '/todos/events', headers={'Authorization': f'Bearer {token}'}
+        )
+
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert response.text == f': user {user.id}\n\n'
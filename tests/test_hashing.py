@@ -0,0 +1,48 @@
+import os
+from http import HTTPStatus
+
+import pytest
+
+from fast_api_exercise.hashing import (
+    check_password,
+    hash_password,
+    password_hasher,
+)
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_runs_in_process_pool():
+    password_hasher.start(workers=1, max_pending=4)
+
+    try:
+        worker_pid = await password_hasher.run(os.getpid)
+        hashed = await password_hasher.run(hash_password, 'secret')
+        valid = await password_hasher.run(check_password, 'secret', hashed)
+    finally:
+        password_hasher.shutdown()
+
+    assert worker_pid != os.getpid()
+    assert valid is True
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_without_pool_runs_inline():
+    hashed = await password_hasher.run(hash_password, 'secret')
+
+    assert await password_hasher.run(os.getpid) == os.getpid()
+    assert check_password('secret', hashed) is True
+
+
+def test_login_returns_503_when_hash_pool_is_saturated(
+    client, user, monkeypatch
+):
+    monkeypatch.setattr(password_hasher, 'max_pending', 0)
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.json() == {'detail': 'Server busy, try again later'}
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,27 @@
+from http import HTTPStatus
+
+from fast_api_exercise.metrics import MetricsRegistry
+
+
+def test_metrics_registry_observe_and_render():
+    registry = MetricsRegistry()
+
+    registry.inc('requests_total')
+    registry.observe('wait_seconds', 0.5)
+    registry.observe('wait_seconds', 1.5)
+    registry.gauge('in_use', lambda: 3)
+
+    assert registry.render() == (
+        'in_use 3\n'
+        'requests_total 1.0\n'
+        'wait_seconds_count 2.0\n'
+        'wait_seconds_sum 2.0\n'
+    )
+
+
+def test_read_metrics_exports_pool_metrics(client):
+    response = client.get('/metrics')
+
+    assert response.status_code == HTTPStatus.OK
+    assert 'db_pool_checked_out' in response.text
+    assert 'db_pool_overflow' in response.text
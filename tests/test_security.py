@@ -1,9 +1,16 @@
+from http import HTTPStatus
+
+import pytest
+from fastapi import HTTPException
 from jwt import decode
 
 from fast_api_exercise.models.user import User
 from fast_api_exercise.security import (
+    Principal,
     create_access_token,
+    get_current_principal,
     get_current_user,
+    principals,
     settings,
 )
 
@@ -23,14 +30,43 @@ def test_create_access_token():
     assert decoded['exp']  # Testa se o valor de exp foi adicionado ao token
 
 
-def test_get_current_user(session, token):
+@pytest.mark.asyncio
+async def test_get_current_user(session, token):
     # act
-    user = get_current_user(session, token)
+    user = await get_current_user(session, token)
 
     # assert
     assert isinstance(user, User)
 
 
+@pytest.mark.asyncio
+async def test_get_current_principal_with_cached_principal(user, token):
+    principal = Principal(user.id, user.email, user.token_version)
+    principals.set(user.email, principal)
+
+    # no session: a cached principal must be enough to authenticate
+    assert await get_current_principal(None, token) == principal
+
+
+@pytest.mark.asyncio
+async def test_get_current_principal_with_revoked_token(session, user, token):
+    user.token_version += 1
+    await session.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        await get_current_principal(session, token)
+
+    assert exc.value.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_get_current_principal_populates_cache(session, user, token):
+    principal = await get_current_principal(session, token)
+
+    assert principal == Principal(user.id, user.email, user.token_version)
+    assert principals.get(user.email) == principal
+
+
 # def test_get_current_user_without_username(session, token):
 #     invalid_token = create_access_token({})
 #     # act
@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import select
+
+from fast_api_exercise.models.user import User
+from fast_api_exercise.schemas import UserPublic
+from fast_api_exercise.serialization import dump_rows
+
+
+@pytest.mark.asyncio
+async def test_dump_rows_from_entities_and_row_tuples(session, user):
+    fields = tuple(UserPublic.model_fields)
+    expected = [
+        {'id': user.id, 'username': user.username, 'email': user.email}
+    ]
+
+    entities = await session.scalars(select(User))
+    rows = await session.execute(select(User.id, User.username, User.email))
+
+    assert dump_rows(entities, fields) == expected
+    assert dump_rows(rows, fields) == expected
@@ -1,8 +1,18 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
 from http import HTTPStatus
+from unittest.mock import patch
 
 import factory.fuzzy
+import pytest
+from sqlalchemy import select, update
 
+from fast_api_exercise.changes import CHANGES_MAX_LIMIT
 from fast_api_exercise.models.user import Todo, TodoState
+from fast_api_exercise.trash import purge_trash
+from fast_api_exercise.write_behind import todo_write_behind
 
 
 class TodoFactory(factory.Factory):
@@ -11,7 +21,8 @@ class TodoFactory(factory.Factory):
 
     title = factory.Faker('text')
     description = factory.Faker('text')
-    state = factory.fuzzy.FuzzyChoice(TodoState)
+    # trashed todos are not listed
+    state = factory.fuzzy.FuzzyChoice(set(TodoState) - {TodoState.trash})
     user_id = 1
 
 
@@ -37,11 +48,12 @@ def test_create_todo(client, token, mock_db_time):
     }
 
 
-def test_list_should_return_5_todos(session, client, user, token):
+@pytest.mark.asyncio
+async def test_list_should_return_5_todos(session, client, user, token):
     # arrange
     expected_todos = 5
-    session.bulk_save_objects(TodoFactory.create_batch(5, user_id=user.id))
-    session.commit()
+    session.add_all(TodoFactory.create_batch(5, user_id=user.id))
+    await session.commit()
 
     # act
     response = client.get(
@@ -52,13 +64,14 @@ def test_list_should_return_5_todos(session, client, user, token):
     assert len(response.json()['todos']) == expected_todos
 
 
-def test_list_todos_pagination_should_return_2_todos(
+@pytest.mark.asyncio
+async def test_list_todos_pagination_should_return_2_todos(
     session, user, client, token
 ):
     # arrange
     expected_todos = 2
-    session.bulk_save_objects(TodoFactory.create_batch(5, user_id=user.id))
-    session.commit()
+    session.add_all(TodoFactory.create_batch(5, user_id=user.id))
+    await session.commit()
 
     # act
     response = client.get(
@@ -70,15 +83,40 @@ def test_list_todos_pagination_should_return_2_todos(
     assert len(response.json()['todos']) == expected_todos
 
 
-def test_list_todos_filter_title_should_return_5_todos(
+@pytest.mark.asyncio
+async def test_list_todos_cursor_pagination_should_walk_all_todos(
+    session, user, client, token
+):
+    # arrange
+    todos = TodoFactory.create_batch(5, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+
+    # act
+    seen, cursor = [], ''
+    for _ in range(3):
+        page = client.get(
+            f'/todos/?limit=2&cursor={cursor}',
+            headers={'Authorization': f'Bearer {token}'},
+        ).json()
+        seen += [todo['id'] for todo in page['todos']]
+        cursor = page['next_cursor']
+
+    # assert
+    assert seen == sorted(todo.id for todo in todos)
+    assert cursor is None
+
+
+@pytest.mark.asyncio
+async def test_list_todos_filter_title_should_return_5_todos(
     session, user, client, token
 ):
     # arrange
     expected_todos = 5
-    session.bulk_save_objects(
+    session.add_all(
         TodoFactory.create_batch(5, user_id=user.id, title='Test todo 1')
     )
-    session.commit()
+    await session.commit()
 
     # act
     response = client.get(
@@ -90,15 +128,16 @@ def test_list_todos_filter_title_should_return_5_todos(
     assert len(response.json()['todos']) == expected_todos
 
 
-def test_list_todos_filter_description_should_return_5_todos(
+@pytest.mark.asyncio
+async def test_list_todos_filter_description_should_return_5_todos(
     session, user, client, token
 ):
     # arrange
     expected_todos = 5
-    session.bulk_save_objects(
+    session.add_all(
         TodoFactory.create_batch(5, user_id=user.id, description='description')
     )
-    session.commit()
+    await session.commit()
 
     # act
     response = client.get(
@@ -110,15 +149,16 @@ def test_list_todos_filter_description_should_return_5_todos(
     assert len(response.json()['todos']) == expected_todos
 
 
-def test_list_todos_filter_state_should_return_5_todos(
+@pytest.mark.asyncio
+async def test_list_todos_filter_state_should_return_5_todos(
     session, user, client, token
 ):
     # arrange
     expected_todos = 5
-    session.bulk_save_objects(
+    session.add_all(
         TodoFactory.create_batch(5, user_id=user.id, state=TodoState.draft)
     )
-    session.commit()
+    await session.commit()
 
     # act
     response = client.get(
@@ -130,12 +170,13 @@ def test_list_todos_filter_state_should_return_5_todos(
     assert len(response.json()['todos']) == expected_todos
 
 
-def test_list_todos_filter_combined_should_return_5_todos(
+@pytest.mark.asyncio
+async def test_list_todos_filter_combined_should_return_5_todos(
     session, user, client, token
 ):
     # arrange
     expected_todos = 5
-    session.bulk_save_objects(
+    session.add_all(
         TodoFactory.create_batch(
             5,
             user_id=user.id,
@@ -145,7 +186,7 @@ def test_list_todos_filter_combined_should_return_5_todos(
         )
     )
 
-    session.bulk_save_objects(
+    session.add_all(
         TodoFactory.create_batch(
             3,
             user_id=user.id,
@@ -154,7 +195,7 @@ def test_list_todos_filter_combined_should_return_5_todos(
             state=TodoState.todo,
         )
     )
-    session.commit()
+    await session.commit()
 
     # act
     response = client.get(
@@ -166,15 +207,16 @@ def test_list_todos_filter_combined_should_return_5_todos(
     assert len(response.json()['todos']) == expected_todos
 
 
-def test_list_todos_should_return_all_expected_fields(
+@pytest.mark.asyncio
+async def test_list_todos_should_return_all_expected_fields(
     session, client, user, token, mock_db_time
 ):
     with mock_db_time(model=Todo) as time:
         todo = TodoFactory.create(user_id=user.id)
         session.add(todo)
-        session.commit()
+        await session.commit()
 
-    session.refresh(todo)
+    await session.refresh(todo)
     response = client.get(
         '/todos/',
         headers={'Authorization': f'Bearer {token}'},
@@ -192,6 +234,42 @@ def test_list_todos_should_return_all_expected_fields(
     ]
 
 
+@pytest.mark.asyncio
+async def test_list_todos_search_should_rank_matches(
+    session, user, client, token
+):
+    # arrange
+    session.add_all([
+        TodoFactory(user_id=user.id, title='Buy milk', description='market'),
+        TodoFactory(user_id=user.id, title='Walk dog', description='park'),
+        TodoFactory(
+            user_id=user.id, title='Milk run', description='milk and bread'
+        ),
+    ])
+    await session.commit()
+
+    # act
+    response = client.get(
+        '/todos/?search=milk',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    # assert
+    assert [todo['title'] for todo in response.json()['todos']] == [
+        'Milk run',
+        'Buy milk',
+    ]
+
+
+def test_list_todos_search_with_cursor_should_fail(client, token):
+    response = client.get(
+        '/todos/?search=milk&cursor=eyJpZCI6IDF9',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
 def test_patch_todo_error(client, token):
     response = client.patch(
         '/todos/10',
@@ -202,11 +280,12 @@ def test_patch_todo_error(client, token):
     assert response.json() == {'detail': 'Todo not found.'}
 
 
-def test_patch_todo(session, client, user, token):
+@pytest.mark.asyncio
+async def test_patch_todo(session, client, user, token):
     todo = TodoFactory(user_id=user.id)
 
     session.add(todo)
-    session.commit()
+    await session.commit()
 
     response = client.patch(
         f'/todos/{todo.id}',
@@ -217,20 +296,179 @@ def test_patch_todo(session, client, user, token):
     assert response.json()['title'] == 'teste!'
 
 
-def test_delete_todo(session, client, user, token):
+@pytest.mark.asyncio
+async def test_patch_todo_with_if_match(session, client, user, token):
     todo = TodoFactory(user_id=user.id)
+    session.add(todo)
+    await session.commit()
 
+    response = client.patch(
+        f'/todos/{todo.id}',
+        json={'title': 'teste!'},
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': f'"{todo.updated_at.isoformat()}"',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['title'] == 'teste!'
+    assert response.headers['ETag'].startswith('"')
+
+
+@pytest.mark.asyncio
+async def test_patch_todo_with_stale_if_match(session, client, user, token):
+    todo = TodoFactory(user_id=user.id)
+    session.add(todo)
+    await session.commit()
+
+    response = client.patch(
+        f'/todos/{todo.id}',
+        json={'title': 'teste!'},
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': '"2000-01-01T00:00:00"',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert response.json() == {'detail': 'Todo has been modified.'}
+
+
+@pytest.mark.asyncio
+async def test_patch_todo_state_with_respond_async(
+    session, client, user, token
+):
+    todo = TodoFactory(user_id=user.id, state=TodoState.todo)
+    session.add(todo)
+    await session.commit()
+
+    with patch.object(
+        todo_write_behind, 'submit', return_value=True
+    ) as submit:
+        response = client.patch(
+            f'/todos/{todo.id}',
+            json={'state': 'done'},
+            headers={
+                'Authorization': f'Bearer {token}',
+                'Prefer': 'respond-async',
+            },
+        )
+
+    await session.refresh(todo)
+
+    assert response.status_code == HTTPStatus.ACCEPTED
+    assert response.headers['Preference-Applied'] == 'respond-async'
+    submit.assert_awaited_once_with(user.id, todo.id, TodoState.done)
+    # written by the write-behind flush, not the request
+    assert todo.state == TodoState.todo
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ('json', 'prefer'),
+    [
+        ({'state': 'done'}, None),
+        ({'state': 'done', 'title': 'teste!'}, 'respond-async'),
+        ({'state': 'trash'}, 'respond-async'),
+    ],
+)
+async def test_patch_todo_writes_through_what_cannot_wait(  # noqa: PLR0913, PLR0917
+    session, client, user, token, json, prefer
+):
+    todo = TodoFactory(user_id=user.id)
     session.add(todo)
-    session.commit()
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    if prefer:
+        headers['Prefer'] = prefer
+
+    with patch.object(todo_write_behind, 'submit') as submit:
+        response = client.patch(
+            f'/todos/{todo.id}', json=json, headers=headers
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['state'] == json['state']
+    submit.assert_not_called()
+
+
+def test_patch_todo_with_if_match_not_found(client, token):
+    response = client.patch(
+        '/todos/10',
+        json={'title': 'teste!'},
+        headers={
+            'Authorization': f'Bearer {token}',
+            'If-Match': '"2000-01-01T00:00:00"',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'detail': 'Todo not found.'}
+
+
+@pytest.mark.asyncio
+async def test_delete_todo_with_stale_if_match(session, client, user, token):
+    todo = TodoFactory(user_id=user.id)
+    session.add(todo)
+    await session.commit()
+
+    response = client.delete(
+        f'/todos/{todo.id}',
+        headers={'Authorization': f'Bearer {token}', 'If-Match': 'invalid'},
+    )
+
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert response.json() == {'detail': 'Todo has been modified.'}
+
+
+@pytest.mark.asyncio
+async def test_delete_todo(session, client, user, token):
+    todo = TodoFactory(user_id=user.id)
+
+    session.add(todo)
+    await session.commit()
 
     response = client.delete(
         f'/todos/{todo.id}', headers={'Authorization': f'Bearer {token}'}
     )
+    await session.refresh(todo)
 
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {
         'message': 'Task has been deleted successfully.'
     }
+    assert todo.state == TodoState.trash
+
+
+@pytest.mark.asyncio
+async def test_delete_todo_twice(session, client, user, token):
+    todo = TodoFactory(user_id=user.id)
+    session.add(todo)
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    client.delete(f'/todos/{todo.id}', headers=headers)
+    response = client.delete(f'/todos/{todo.id}', headers=headers)
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_list_todos_hides_trash(session, client, user, token):
+    session.add_all([
+        TodoFactory(user_id=user.id, state=TodoState.todo),
+        TodoFactory(user_id=user.id, state=TodoState.trash),
+    ])
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    listed = client.get('/todos/', headers=headers).json()['todos']
+    trashed = client.get('/todos/?state=trash', headers=headers).json()
+
+    assert [todo['state'] for todo in listed] == ['todo']
+    assert [todo['state'] for todo in trashed['todos']] == ['trash']
 
 
 def test_delete_todo_error(client, token):
@@ -240,3 +478,517 @@ def test_delete_todo_error(client, token):
 
     assert response.status_code == HTTPStatus.NOT_FOUND
     assert response.json() == {'detail': 'Todo not found.'}
+
+
+def test_create_todos_bulk(client, token):
+    response = client.post(
+        '/todos/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=[
+            {'title': 'First', 'description': 'first todo'},
+            {'title': 'Second', 'description': 'second todo'},
+        ],
+    )
+
+    results = response.json()['results']
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert [result['status'] for result in results] == [201, 201]
+    assert [result['todo']['title'] for result in results] == [
+        'First',
+        'Second',
+    ]
+    assert all(result['todo']['state'] == 'draft' for result in results)
+
+
+@pytest.mark.asyncio
+async def test_patch_todos_bulk(session, client, user, other_user, token):
+    todos = TodoFactory.create_batch(2, user_id=user.id, state=TodoState.todo)
+    other_todo = TodoFactory(user_id=other_user.id)
+    session.add_all([*todos, other_todo])
+    await session.commit()
+
+    response = client.patch(
+        '/todos/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=[
+            {'id': todos[0].id, 'state': 'done'},
+            {'id': todos[1].id, 'title': 'Renamed'},
+            {'id': other_todo.id, 'title': 'Not mine'},
+        ],
+    )
+
+    results = response.json()['results']
+
+    assert response.status_code == HTTPStatus.OK
+    assert [result['status'] for result in results] == [200, 200, 404]
+    assert results[0]['todo']['state'] == 'done'
+    assert results[0]['todo']['title'] == todos[0].title
+    assert results[1]['todo']['title'] == 'Renamed'
+    assert results[1]['todo']['state'] == 'todo'
+
+
+def test_patch_todos_bulk_with_duplicate_ids(client, token):
+    response = client.patch(
+        '/todos/bulk',
+        headers={'Authorization': f'Bearer {token}'},
+        json=[{'id': 1, 'state': 'done'}, {'id': 1, 'state': 'todo'}],
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json() == {'detail': 'Duplicate todo ids.'}
+
+
+@pytest.mark.asyncio
+async def test_delete_todos_bulk(session, client, user, token):
+    todos = TodoFactory.create_batch(2, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+
+    response = client.delete(
+        f'/todos/bulk?ids={todos[0].id}&ids={todos[1].id}&ids=999',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'results': [
+            {'id': todos[0].id, 'status': 200, 'todo': None},
+            {'id': todos[1].id, 'status': 200, 'todo': None},
+            {'id': 999, 'status': 404, 'todo': None},
+        ]
+    }
+
+
+@pytest.mark.asyncio
+async def test_export_todos_ndjson(session, client, user, other_user, token):
+    session.add_all(
+        TodoFactory.create_batch(5, user_id=user.id, state=TodoState.done)
+    )
+    session.add_all(
+        TodoFactory.create_batch(2, user_id=user.id, state=TodoState.draft)
+    )
+    session.add_all(
+        TodoFactory.create_batch(
+            3, user_id=other_user.id, state=TodoState.done
+        )
+    )
+    await session.commit()
+
+    # several partitions from the server-side cursor
+    with patch('fast_api_exercise.routers.todos.EXPORT_BATCH_SIZE', 2):
+        response = client.get(
+            '/todos/export?state=done',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+
+    todos = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [todo['id'] for todo in todos] == [1, 2, 3, 4, 5]
+    assert {todo['state'] for todo in todos} == {'done'}
+    assert set(todos[0]) == {
+        'id',
+        'title',
+        'description',
+        'state',
+        'created_at',
+        'updated_at',
+    }
+
+
+@pytest.mark.asyncio
+async def test_export_todos_csv(session, client, user, token):
+    session.add(
+        TodoFactory(
+            title='Test todo',
+            description='Line one, "quoted"\nline two',
+            state=TodoState.todo,
+            user_id=user.id,
+        )
+    )
+    await session.commit()
+
+    response = client.get(
+        '/todos/export?format=csv',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'].startswith('text/csv')
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+
+    assert len(rows) == 1
+    assert rows[0]['title'] == 'Test todo'
+    assert rows[0]['description'] == 'Line one, "quoted"\nline two'
+    assert rows[0]['state'] == 'todo'
+
+
+def test_export_todos_csv_without_todos(client, token):
+    response = client.get(
+        '/todos/export?format=csv',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.text.splitlines() == [
+        'title,description,id,state,created_at,updated_at'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_import_todos_ndjson(session, client, user, token):
+    body = (
+        '{"title": "First", "description": "one"}\n'
+        '\n'
+        '{"title": "Second"}\n'
+        '{"title": "Third", "description": "three"}\n'
+    )
+
+    response = client.post(
+        '/todos/import',
+        headers={'Authorization': f'Bearer {token}'},
+        content=body,
+    )
+
+    assert response.status_code == HTTPStatus.OK
+
+    result = response.json()
+
+    assert result['imported'] == 2  # noqa: PLR2004
+    assert result['failed'] == 1
+    assert result['errors'] == [
+        {
+            'row': 2,
+            'errors': [
+                {
+                    'type': 'missing',
+                    'loc': ['description'],
+                    'msg': 'Field required',
+                }
+            ],
+        }
+    ]
+
+    todos = (await session.scalars(select(Todo).order_by(Todo.id))).all()
+
+    assert [(todo.title, todo.state, todo.user_id) for todo in todos] == [
+        ('First', TodoState.draft, user.id),
+        ('Third', TodoState.draft, user.id),
+    ]
+
+
+def test_import_todos_reports_nul_characters(client, token):
+    body = (
+        '{"title": "First", "description": "one"}\n'
+        '{"title": "Sec\\u0000ond", "description": "two"}\n'
+    )
+
+    response = client.post(
+        '/todos/import',
+        headers={'Authorization': f'Bearer {token}'},
+        content=body,
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['imported'] == 1
+    assert response.json()['errors'] == [
+        {
+            'row': 2,
+            'errors': [
+                {
+                    'type': 'value_error',
+                    'loc': ['title'],
+                    'msg': 'Value error, NUL characters are not allowed',
+                }
+            ],
+        }
+    ]
+
+
+def test_import_todos_csv_in_chunks(client, token):
+    body = (
+        'id,title,description\n'
+        '7,Café,"Line one,\nline ""two"""\n'
+        '8,Second,plain\n'
+    ).encode()
+    # split inside the quoted field and inside the "é"
+    chunks = [body[:27], body[27:36], body[36:]]
+
+    response = client.post(
+        '/todos/import?format=csv',
+        headers={'Authorization': f'Bearer {token}'},
+        content=iter(chunks),
+    )
+
+    assert response.json()['imported'] == 2  # noqa: PLR2004
+
+    response = client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert [
+        (todo['title'], todo['description'])
+        for todo in response.json()['todos']
+    ] == [('Café', 'Line one,\nline "two"'), ('Second', 'plain')]
+
+
+@pytest.mark.asyncio
+async def test_list_todos_with_sparse_fields(session, client, user, token):
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+
+    response = client.get(
+        '/todos/?fields=title,state&limit=2',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    todos = response.json()['todos']
+
+    assert response.status_code == HTTPStatus.OK
+    assert [set(todo) for todo in todos] == [{'title', 'state'}] * 2
+
+    # paging still works without id in the payload
+    response = client.get(
+        f'/todos/?fields=title&cursor={response.json()["next_cursor"]}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert len(response.json()['todos']) == 1
+
+
+def test_list_todos_with_unknown_fields(client, token):
+    response = client.get(
+        '/todos/?fields=title,password',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json()['detail'][0]['msg'] == (
+        'Value error, Unknown fields: password'
+    )
+
+
+@pytest.mark.asyncio
+async def test_list_todos_conditional_get(session, client, user, token):
+    todo = TodoFactory(user_id=user.id)
+    session.add(todo)
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    etag = client.get('/todos/', headers=headers).headers['ETag']
+
+    response = client.get(
+        '/todos/', headers={**headers, 'If-None-Match': etag}
+    )
+
+    assert etag.startswith('W/')
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers['ETag'] == etag
+    assert not response.content
+
+    client.patch(f'/todos/{todo.id}', headers=headers, json={'state': 'done'})
+    response = client.get(
+        '/todos/', headers={**headers, 'If-None-Match': etag}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] != etag
+
+
+@pytest.mark.asyncio
+async def test_list_todos_etag_comes_from_the_rows_sent(
+    session, client, user, token, statements
+):
+    todo = TodoFactory(user_id=user.id)
+    session.add(todo)
+    await session.commit()
+    statements.clear()
+
+    response = client.get(
+        '/todos/?fields=title', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.json()['todos'] == [{'title': todo.title}]
+    assert response.headers['ETag'].startswith('W/')
+    # a second SELECT could see a newer snapshot than the ETag
+    assert len([sql for sql in statements if 'todos' in sql]) == 1
+
+
+@pytest.mark.asyncio
+async def test_list_todos_etag_changes_when_a_row_moves_into_the_page(
+    session, client, user, token
+):
+    todos = TodoFactory.create_batch(3, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+
+    # older ids were updated last, so the page's max updated_at is stable
+    for day, todo in zip((3, 2, 1), todos):
+        await session.execute(
+            update(Todo)
+            .where(Todo.id == todo.id)
+            .values(updated_at=datetime(2024, 1, day))
+        )
+
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    etag = client.get('/todos/?limit=2', headers=headers).headers['ETag']
+    client.delete(f'/todos/{todos[1].id}', headers=headers)
+    response = client.get(
+        '/todos/?limit=2', headers={**headers, 'If-None-Match': etag}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert [todo['id'] for todo in response.json()['todos']] == [
+        todos[0].id,
+        todos[2].id,
+    ]
+    assert response.headers['ETag'] != etag
+
+
+@pytest.mark.asyncio
+# no transaction outlives the requests of these tests
+@patch('fast_api_exercise.changes.CHANGES_SETTLE_SECONDS', 0)
+async def test_todo_changes_since_watermark(session, client, user, token):
+    todos = TodoFactory.create_batch(3, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    response = client.get('/todos/changes', headers=headers).json()
+
+    assert [todo['id'] for todo in response['todos']] == [1, 2, 3]
+    assert response['deleted'] == []
+    assert response['has_more'] is False
+
+    watermark = response['watermark']
+    client.patch('/todos/2', headers=headers, json={'state': 'done'})
+    client.delete('/todos/3', headers=headers)
+
+    response = client.get(
+        f'/todos/changes?since={watermark}', headers=headers
+    ).json()
+
+    # trashing is an update; the purge is what leaves a tombstone
+    assert [todo['id'] for todo in response['todos']] == [2, 3]
+    assert [todo['state'] for todo in response['todos']] == ['done', 'trash']
+    assert response['deleted'] == []
+
+    watermark = response['watermark']
+    await purge_trash(session, timedelta(0), batch_size=10)
+    response = client.get(
+        f'/todos/changes?since={watermark}', headers=headers
+    ).json()
+
+    assert response['todos'] == []
+    assert response['deleted'] == [3]
+
+    watermark = response['watermark']
+    response = client.get(
+        f'/todos/changes?since={watermark}', headers=headers
+    ).json()
+
+    assert response == {
+        'todos': [],
+        'deleted': [],
+        'watermark': watermark,
+        'has_more': False,
+    }
+
+
+@pytest.mark.asyncio
+# no transaction outlives the requests of these tests
+@patch('fast_api_exercise.changes.CHANGES_SETTLE_SECONDS', 0)
+async def test_todo_changes_pages_with_limit(session, client, user, token):
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first = client.get('/todos/changes?limit=2', headers=headers).json()
+    second = client.get(
+        f'/todos/changes?limit=2&since={first["watermark"]}', headers=headers
+    ).json()
+
+    assert [todo['id'] for todo in first['todos']] == [1, 2]
+    assert first['has_more'] is True
+    assert [todo['id'] for todo in second['todos']] == [3]
+    assert second['has_more'] is False
+
+
+@pytest.mark.asyncio
+async def test_todo_changes_send_unsettled_changes_again(
+    session, client, user, token
+):
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first = client.get('/todos/changes?limit=2', headers=headers).json()
+    # a new transaction, with a later now()
+    await session.commit()
+    second = client.get(
+        f'/todos/changes?limit=2&since={first["watermark"]}', headers=headers
+    ).json()
+
+    # a transaction still running could commit before these todos, so the
+    # watermark stays behind them and the client waits for them to settle
+    assert [todo['id'] for todo in first['todos']] == [1, 2]
+    assert first['has_more'] is False
+    assert [todo['id'] for todo in second['todos']] == [1, 2]
+    assert second['has_more'] is False
+
+
+def test_todo_changes_with_invalid_watermark(client, token):
+    response = client.get(
+        '/todos/changes?since=invalid',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize('limit', [-1, 0, CHANGES_MAX_LIMIT + 1])
+def test_todo_changes_with_invalid_limit(client, token, limit):
+    response = client.get(
+        f'/todos/changes?limit={limit}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_todo_stats_follow_every_write(session, client, user, token):
+    session.add_all([
+        TodoFactory(user_id=user.id, state=TodoState.todo),
+        TodoFactory(user_id=user.id, state=TodoState.todo),
+        TodoFactory(user_id=user.id, state=TodoState.doing),
+    ])
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    client.patch('/todos/1', headers=headers, json={'state': 'done'})
+    client.patch('/todos/2', headers=headers, json={'title': 'renamed'})
+    client.delete('/todos/3', headers=headers)
+    client.post(
+        '/todos/import?format=csv',
+        headers=headers,
+        content='title,description,state\na,b,draft\nc,d,draft\n',
+    )
+
+    response = client.get('/todos/stats', headers=headers)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'states': {
+            'draft': 2,
+            'todo': 1,
+            'doing': 0,
+            'done': 1,
+            'trash': 1,
+        },
+        'total': 5,
+    }
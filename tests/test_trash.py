@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from fast_api_exercise.metrics import metrics
+from fast_api_exercise.models.user import Todo, TodoState, TodoTombstone
+from fast_api_exercise.trash import purge_trash
+
+
+@pytest.mark.asyncio
+async def test_purge_trash_deletes_old_trash_in_batches(session, user):
+    session.add_all([
+        Todo(title=str(i), description='', user_id=user.id, state=state)
+        for i, state in enumerate([TodoState.trash] * 5 + [TodoState.done])
+    ])
+    await session.commit()
+    purged_total = metrics.value('todos_purged_total')
+
+    purged = await purge_trash(session, timedelta(0), batch_size=2)
+
+    assert purged == 5  # noqa: PLR2004
+    assert metrics.value('todos_purged_total') == purged_total + 5
+    assert await session.scalar(select(Todo.state)) == TodoState.done
+    assert await session.scalar(select(func.count(TodoTombstone.id))) == 5  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_purge_trash_keeps_recent_trash(session, user):
+    session.add(
+        Todo(title='', description='', user_id=user.id, state=TodoState.trash)
+    )
+    await session.commit()
+
+    purged = await purge_trash(session, timedelta(days=1), batch_size=2)
+
+    assert purged == 0
+    assert await session.scalar(select(func.count(Todo.id))) == 1
@@ -1,6 +1,11 @@
 from http import HTTPStatus
 
+import pytest
+from sqlalchemy import func, select
+
+from fast_api_exercise.models.user import Todo
 from fast_api_exercise.schemas import UserPublic
+from fast_api_exercise.security import principals
 
 
 def test_create_user(client):
@@ -60,7 +65,42 @@ def test_read_users(client):
 
     # assert
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'users': []}
+    assert response.json() == {'users': [], 'next_cursor': None}
+
+
+def test_read_users_with_cursor(client, user, other_user):
+    # act
+    first_page = client.get('/users/?limit=1').json()
+    second_page = client.get(
+        f'/users/?limit=1&cursor={first_page["next_cursor"]}'
+    ).json()
+
+    # assert
+    assert [u['id'] for u in first_page['users']] == [user.id]
+    assert [u['id'] for u in second_page['users']] == [other_user.id]
+
+
+def test_read_users_selects_only_public_columns(client, user, statements):
+    statements.clear()
+
+    response = client.get('/users/')
+
+    # assert
+    assert response.json()['users'] == [
+        {'id': user.id, 'username': user.username, 'email': user.email}
+    ]
+    # one query, without the password hash or the todos relationship
+    assert len(statements) == 1
+    assert 'password' not in statements[0]
+    assert 'todos' not in statements[0]
+
+
+def test_read_users_with_invalid_cursor(client):
+    # act
+    response = client.get('/users/?cursor=invalid')
+
+    # assert
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
 
 
 def test_read_user(client, user):
@@ -75,6 +115,54 @@ def test_read_user(client, user):
     assert response.json() == user_schema
 
 
+def test_read_user_with_sparse_fields(client, user):
+    # act
+    response = client.get(f'/users/{user.id}?fields=username')
+
+    # assert
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'username': user.username}
+
+
+def test_read_users_with_unknown_fields(client):
+    # act
+    response = client.get('/users/?fields=id,password')
+
+    # assert
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json()['detail'][0]['msg'] == (
+        'Value error, Unknown fields: password'
+    )
+
+
+def test_read_user_conditional_get(client, user, token):
+    # arrange
+    etag = client.get(f'/users/{user.id}').headers['ETag']
+
+    # act
+    response = client.get(f'/users/{user.id}', headers={'If-None-Match': etag})
+
+    # assert
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert not response.content
+
+    # act
+    client.put(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={
+            'username': 'bob',
+            'email': 'bob@example.com',
+            'password': 'mynewpassword',
+        },
+    )
+    response = client.get(f'/users/{user.id}', headers={'If-None-Match': etag})
+
+    # assert
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] != etag
+
+
 def test_read_user_with_error_user_not_found(client):
     # act
     response = client.get('/users/999')
@@ -93,7 +181,10 @@ def test_read_users_with_users(client, user):
 
     # assert
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'users': [user_schema]}
+    assert response.json() == {
+        'users': [user_schema],
+        'next_cursor': None,
+    }
 
 
 def test_update_user(client, user, token):
@@ -172,3 +263,53 @@ def test_delete_user_with_wrong_user(client, other_user, token):
     # assert
     assert response.status_code == HTTPStatus.FORBIDDEN
     assert response.json() == {'detail': 'Not enough permissions'}
+
+
+def test_update_user_invalidates_cached_principal(client, user, token):
+    old_email = user.email
+    client.get('/todos/', headers={'Authorization': f'Bearer {token}'})
+    assert principals.get(old_email)
+
+    client.put(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={
+            'username': 'bob',
+            'email': 'bob@example.com',
+            'password': 'mynewpassword',
+        },
+    )
+
+    assert principals.get(old_email) is None
+    assert principals.get('bob@example.com') is None
+
+
+def test_delete_user_invalidates_cached_principal(client, user, token):
+    client.get('/todos/', headers={'Authorization': f'Bearer {token}'})
+    assert principals.get(user.email)
+
+    client.delete(
+        f'/users/{user.id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert principals.get(user.email) is None
+
+
+@pytest.mark.asyncio
+async def test_delete_user_leaves_todos_to_the_cascade(
+    session, client, user, token, statements
+):
+    session.add_all([
+        Todo(title=str(i), description='', user_id=user.id) for i in range(5)
+    ])
+    await session.commit()
+    statements.clear()
+
+    response = client.delete(
+        f'/users/{user.id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.json() == {'message': 'User deleted'}
+    # the todos are neither loaded nor deleted by the ORM
+    assert not [statement for statement in statements if 'todos' in statement]
+    assert await session.scalar(select(func.count(Todo.id))) == 0
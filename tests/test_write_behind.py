@@ -0,0 +1,207 @@
+import asyncio
+import threading
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, update
+
+from fast_api_exercise.metrics import metrics
+from fast_api_exercise.models.user import Todo, TodoState
+from fast_api_exercise.settings import Settings
+from fast_api_exercise.write_behind import TodoWriteBehind, read_journal
+
+
+@pytest.fixture
+def settings(tmp_path):
+    # flushed by the tests, never by the timer
+    return Settings(
+        TODO_WRITE_BEHIND_INTERVAL_MS=60_000,
+        TODO_WRITE_BEHIND_MAX_PENDING=3,
+        TODO_WRITE_BEHIND_JOURNAL=str(tmp_path / 'todos.journal'),
+    )
+
+
+@pytest_asyncio.fixture
+async def todos(session, user):
+    todos = [
+        Todo(title=str(i), description='', user_id=user.id, state=state)
+        for i, state in enumerate([TodoState.todo] * 3 + [TodoState.trash])
+    ]
+    session.add_all(todos)
+    await session.commit()
+
+    return todos
+
+
+async def states(session):
+    todos = await session.execute(
+        select(Todo.id, Todo.state)
+        .order_by(Todo.id)
+        .execution_options(populate_existing=True)
+    )
+
+    return dict(todos.all())
+
+
+@pytest.mark.asyncio
+async def test_write_behind_coalesces_and_flushes_in_one_batch(
+    session, settings, user, todos
+):
+    write_behind = TodoWriteBehind()
+    await write_behind.start(session.bind, settings)
+    first, second, third, trashed = (todo.id for todo in todos)
+    flushed_total = metrics.value('todo_write_behind_flushed_total')
+
+    for todo_id, state in [
+        (first, TodoState.doing),
+        (first, TodoState.done),
+        (second, TodoState.doing),
+        (trashed, TodoState.todo),
+    ]:
+        assert await write_behind.submit(user.id, todo_id, state)
+
+    # more todos than max_pending are written through
+    assert not await write_behind.submit(user.id, third, TodoState.done)
+    assert await states(session) == {
+        first: TodoState.todo,
+        second: TodoState.todo,
+        third: TodoState.todo,
+        trashed: TodoState.trash,
+    }
+
+    flushed = await write_behind.flush()
+    await write_behind.stop()
+
+    # trashed todos stay in the trash
+    assert flushed == 2  # noqa: PLR2004
+    assert metrics.value('todo_write_behind_flushed_total') == (
+        flushed_total + 2
+    )
+    assert await states(session) == {
+        first: TodoState.done,
+        second: TodoState.doing,
+        third: TodoState.todo,
+        trashed: TodoState.trash,
+    }
+    assert not read_journal(write_behind._path)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_skips_todos_written_after_the_flip(
+    session, settings, user, todos
+):
+    write_behind = TodoWriteBehind()
+    await write_behind.start(session.bind, settings)
+    first, second = todos[0].id, todos[1].id
+
+    await write_behind.submit(user.id, first, TodoState.done)
+    await write_behind.submit(user.id, second, TodoState.done)
+    # written through by a worker without the journal, so not discarded
+    await session.execute(
+        update(Todo).where(Todo.id == first).values(state=TodoState.doing)
+    )
+    await session.commit()
+
+    flushed = await write_behind.flush()
+    await write_behind.stop()
+
+    assert flushed == 1
+    assert await states(session) == {
+        first: TodoState.doing,
+        second: TodoState.done,
+        todos[2].id: TodoState.todo,
+        todos[3].id: TodoState.trash,
+    }
+
+
+@pytest.mark.asyncio
+async def test_write_behind_replays_its_journal_after_a_crash(
+    session, settings, user, todos
+):
+    crashed = TodoWriteBehind()
+    await crashed.start(session.bind, settings)
+    first, second, third, trashed = (todo.id for todo in todos)
+
+    await crashed.submit(user.id, first, TodoState.doing)
+    await crashed.submit(user.id, second, TodoState.doing)
+    await crashed.submit(user.id, first, TodoState.done)
+    # written through, so its queued flip must not come back
+    await crashed.discard(user.id, [second])
+
+    with open(settings.TODO_WRITE_BEHIND_JOURNAL, 'ab') as journal:
+        journal.write(b'[1, 2, "do')
+
+    # the flusher dies with the process, which releases the journal
+    crashed._task.cancel()
+    crashed._journal_lock.close()
+
+    restarted = TodoWriteBehind()
+    await restarted.start(session.bind, settings)
+    await restarted.stop()
+
+    assert await states(session) == {
+        first: TodoState.done,
+        second: TodoState.todo,
+        third: TodoState.todo,
+        trashed: TodoState.trash,
+    }
+
+
+@pytest.mark.asyncio
+async def test_write_behind_is_disabled_without_interval(session, user):
+    write_behind = TodoWriteBehind()
+    await write_behind.start(session.bind, Settings())
+
+    assert not await write_behind.submit(user.id, 1, TodoState.done)
+
+
+@pytest.mark.asyncio
+async def test_discard_waits_until_flushed_flips_leave_the_journal(
+    session, settings, user, todos, monkeypatch
+):
+    write_behind = TodoWriteBehind()
+    await write_behind.start(session.bind, settings)
+    todo_id = todos[0].id
+    await write_behind.submit(user.id, todo_id, TodoState.done)
+    rewriting, rewrite = threading.Event(), threading.Event()
+    rewrite_journal = write_behind._rewrite_journal
+
+    def slow_rewrite_journal(states):
+        rewriting.set()
+        rewrite.wait(5)
+        rewrite_journal(states)
+
+    monkeypatch.setattr(write_behind, '_rewrite_journal', slow_rewrite_journal)
+    flush = asyncio.create_task(write_behind.flush())
+    await asyncio.to_thread(rewriting.wait, 5)
+    discard = asyncio.create_task(write_behind.discard(user.id, [todo_id]))
+    await asyncio.sleep(0.1)
+
+    # committed, but a crash now would still replay the flip
+    assert not discard.done()
+
+    rewrite.set()
+    await asyncio.gather(flush, discard)
+    await write_behind.stop()
+
+    assert not read_journal(write_behind._path)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_journal_has_a_single_owner(
+    session, settings, user
+):
+    owner, other = TodoWriteBehind(), TodoWriteBehind()
+    await owner.start(session.bind, settings)
+    await other.start(session.bind, settings)
+
+    assert await owner.submit(user.id, 1, TodoState.done)
+    # another worker with the same settings writes through
+    assert not await other.submit(user.id, 1, TodoState.done)
+
+    await owner.stop()
+    await other.start(session.bind, settings)
+
+    assert await other.submit(user.id, 1, TodoState.done)
+
+    await other.stop()